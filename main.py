@@ -1,13 +1,34 @@
+import time
+
+# Taken before every other import so --startup-profile can include them.
+STARTUP_T0 = time.perf_counter()
+
+import argparse
+import functools
+import gc
+import hashlib
+import heapq
+import itertools
+import json
 import math
+import os
+import platform
 import random
+import struct
 import sys
+import zlib
+from collections import Counter, OrderedDict, deque
 
+import numpy as np
 import pygame
 
 
 WIDTH = 800
 HEIGHT = 600
 FPS = 60
+SIM_HZ = 120
+SIM_DT = 1.0 / SIM_HZ
+MAX_CATCHUP_S = 1.0 / 20
 
 PLAYER_SPEED = 280.0
 PLAYER_SLOW_MULT = 0.45
@@ -57,16 +78,53 @@ def clamp(v, lo, hi):
     return lo if v < lo else hi if v > hi else v
 
 
+def max_sim_steps(sim_hz):
+    # Catch up at most 1/20 s of simulation per frame, whatever the tick rate.
+    return max(1, math.ceil(sim_hz * MAX_CATCHUP_S))
+
+
+def lerp(a, b, t):
+    return a + (b - a) * t
+
+
 def dist2(ax, ay, bx, by):
     dx = ax - bx
     dy = ay - by
     return dx * dx + dy * dy
 
 
+class InputFrame:
+    __slots__ = ("left", "right", "up", "down", "slow", "shoot", "super_pressed", "upgrade_pick")
+
+    def __init__(self):
+        self.left = False
+        self.right = False
+        self.up = False
+        self.down = False
+        self.slow = False
+        self.shoot = False
+        self.clear_edges()
+
+    def clear_edges(self):
+        self.super_pressed = False
+        self.upgrade_pick = -1
+
+
+def read_keys(keys, inputs):
+    inputs.left = bool(keys[pygame.K_a] or keys[pygame.K_LEFT])
+    inputs.right = bool(keys[pygame.K_d] or keys[pygame.K_RIGHT])
+    inputs.up = bool(keys[pygame.K_w] or keys[pygame.K_UP])
+    inputs.down = bool(keys[pygame.K_s] or keys[pygame.K_DOWN])
+    inputs.slow = bool(keys[pygame.K_LSHIFT] or keys[pygame.K_RSHIFT])
+    inputs.shoot = bool(keys[pygame.K_z] or keys[pygame.K_SPACE])
+
+
 class Player:
     def __init__(self):
         self.x = WIDTH * 0.5
         self.y = HEIGHT * 0.82
+        self.prev_x = self.x
+        self.prev_y = self.y
 
         self.move_speed = PLAYER_SPEED
         self.bullet_damage = 1
@@ -81,6 +139,8 @@ class Player:
     def reset_position(self):
         self.x = WIDTH * 0.5
         self.y = HEIGHT * 0.82
+        self.prev_x = self.x
+        self.prev_y = self.y
 
     def reset_run_stats(self):
         self.move_speed = PLAYER_SPEED
@@ -96,20 +156,22 @@ class Player:
         self.reset_position()
         self.reset_run_stats()
 
-    def update(self, dt, keys):
+    def update(self, dt, inputs):
+        self.prev_x = self.x
+        self.prev_y = self.y
         speed = self.move_speed
-        if keys[pygame.K_LSHIFT] or keys[pygame.K_RSHIFT]:
+        if inputs.slow:
             speed *= PLAYER_SLOW_MULT
 
         dx = 0.0
         dy = 0.0
-        if keys[pygame.K_a] or keys[pygame.K_LEFT]:
+        if inputs.left:
             dx -= 1.0
-        if keys[pygame.K_d] or keys[pygame.K_RIGHT]:
+        if inputs.right:
             dx += 1.0
-        if keys[pygame.K_w] or keys[pygame.K_UP]:
+        if inputs.up:
             dy -= 1.0
-        if keys[pygame.K_s] or keys[pygame.K_DOWN]:
+        if inputs.down:
             dy += 1.0
 
         if dx != 0.0 or dy != 0.0:
@@ -124,14 +186,21 @@ class Player:
         self.x = clamp(self.x, pad, WIDTH - pad)
         self.y = clamp(self.y, pad, HEIGHT - pad)
 
-        self.shot_cd = max(0.0, self.shot_cd - dt)
+        # Letting the shot cooldown run up to one tick negative records how late
+        # in the tick the gun came off cooldown.
+        self.shot_cd = max(-dt, self.shot_cd - dt)
         self.super_cd = max(0.0, self.super_cd - dt)
 
     def can_shoot(self):
         return self.shot_cd <= 0.0
 
-    def shoot(self):
-        self.shot_cd = PLAYER_SHOT_COOLDOWN
+    def shoot(self, carry=False):
+        if not carry:
+            self.shot_cd = PLAYER_SHOT_COOLDOWN
+            return 0.0
+        late = -self.shot_cd
+        self.shot_cd += PLAYER_SHOT_COOLDOWN
+        return late
 
     def can_super(self):
         return self.super_cd <= 0.0
@@ -144,79 +213,519 @@ class Enemy:
     def __init__(self):
         self.x = WIDTH * 0.5
         self.y = HEIGHT * 0.22
+        self.prev_x = self.x
+        self.prev_y = self.y
         self.t = 0.0
         self.base_x = self.x
 
     def reset(self):
         self.x = WIDTH * 0.5
         self.y = HEIGHT * 0.22
+        self.prev_x = self.x
+        self.prev_y = self.y
         self.t = 0.0
         self.base_x = self.x
 
     def update(self, dt):
+        self.prev_x = self.x
+        self.prev_y = self.y
         self.t += dt
-        self.x = self.base_x + math.sin(self.t * 0.9) * 220.0
+        self.x = self.x_at(self.t)
 
+    def x_at(self, t):
+        return self.base_x + math.sin(t * 0.9) * 220.0
 
-class Bullet:
-    def __init__(self, x, y, vx, vy, radius, friendly, damage=1):
-        self.x = x
-        self.y = y
-        self.vx = vx
-        self.vy = vy
+
+class AllocationCounter:
+    __slots__ = ("total", "frame_start", "last_frame")
+
+    def __init__(self):
+        self.total = 0
+        self.frame_start = 0
+        self.last_frame = 0
+
+    def begin_frame(self):
+        self.last_frame = self.total - self.frame_start
+        self.frame_start = self.total
+
+
+ALLOCATIONS = AllocationCounter()
+
+
+class BulletKind:
+    __slots__ = ("name", "radius", "color", "friendly")
+
+    def __init__(self, name, radius, color, friendly):
+        self.name = name
         self.radius = radius
+        self.color = color
         self.friendly = friendly
-        self.damage = damage
-        self.dead = False
+
+
+KIND_PLAYER = 0
+KIND_SUPER = 1
+KIND_ENEMY = 2
+
+BULLET_KINDS = (
+    BulletKind("player", PLAYER_BULLET_RADIUS, (110, 200, 255), True),
+    BulletKind("super", SUPER_BULLET_RADIUS, (60, 150, 255), True),
+    BulletKind("enemy", ENEMY_BULLET_RADIUS, (255, 200, 90), False),
+)
+KIND_RADIUS = np.array([kind.radius for kind in BULLET_KINDS], dtype=np.float64)
+
+
+BULLET_FIELDS = (
+    ("x", np.float64),
+    ("y", np.float64),
+    ("px", np.float64),
+    ("py", np.float64),
+    ("vx", np.float64),
+    ("vy", np.float64),
+    ("damage", np.int64),
+    ("kind", np.uint8),
+    ("alive", np.bool_),
+)
+ANALYTIC_FIELDS = (
+    ("ox", np.float64),
+    ("oy", np.float64),
+    ("t0", np.float64),
+    ("serial", np.int64),
+)
+
+MOTION_MODES = ("integrate", "analytic")
+CULL_MARGIN_X = 40
+CULL_MARGIN_Y = 60
+GRID_REBUILD_TICKS = 4
+
+
+def exit_times(x, y, vx, vy):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tx = np.where(vx > 0, (WIDTH + CULL_MARGIN_X - x) / vx, (-CULL_MARGIN_X - x) / vx)
+        ty = np.where(vy > 0, (HEIGHT + CULL_MARGIN_Y - y) / vy, (-CULL_MARGIN_Y - y) / vy)
+    tx[vx == 0] = np.inf
+    ty[vy == 0] = np.inf
+    return np.minimum(tx, ty)
+
+
+class BulletField:
+    def __init__(self, capacity=256, motion="integrate"):
+        self.count = 0
+        self.capacity = capacity
+        self.analytic = motion == "analytic"
+        self.fields = BULLET_FIELDS + ANALYTIC_FIELDS if self.analytic else BULLET_FIELDS
+        for name, dtype in self.fields:
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+        # Analytic mode: positions are ox + vx * (t - t0), culling pops a heap of
+        # precomputed exit times, and dead rows stay put until the next grid
+        # rebuild so the grid's row indices remain valid in between.
+        self.t = 0.0
+        self.tick = 0
+        self.last_dt = 0.0
+        self.synced = 0
+        self.epoch = 0
+        self.dead = 0
+        self.max_speed = 0.0
+        self.next_serial = 0
+        self.expiry = []
+        self.row_of = {}
+
+    def __len__(self):
+        return self.count - self.dead
+
+    def _grow(self, needed):
+        cap = self.capacity
+        while cap < needed:
+            cap *= 2
+        for name, dtype in self.fields:
+            arr = np.zeros(cap, dtype=dtype)
+            arr[: self.count] = getattr(self, name)[: self.count]
+            setattr(self, name, arr)
+        self.capacity = cap
+        ALLOCATIONS.total += 1
+
+    def _track(self, i, j):
+        self.ox[i:j] = self.x[i:j]
+        self.oy[i:j] = self.y[i:j]
+        self.t0[i:j] = self.t
+        serials = range(self.next_serial, self.next_serial + (j - i))
+        self.serial[i:j] = serials
+        self.next_serial += j - i
+        self.row_of.update(zip(serials, range(i, j)))
+        t_exit = self.t + exit_times(self.x[i:j], self.y[i:j], self.vx[i:j], self.vy[i:j])
+        for t, serial in zip(t_exit.tolist(), serials):
+            heapq.heappush(self.expiry, (t, serial))
+
+    def spawn(self, x, y, vx, vy, kind, damage=1, lead=0.0):
+        if lead:
+            x += vx * lead
+            y += vy * lead
+        i = self.count
+        if i >= self.capacity:
+            self._grow(i + 1)
+        self.x[i] = x
+        self.y[i] = y
+        self.px[i] = x
+        self.py[i] = y
+        self.vx[i] = vx
+        self.vy[i] = vy
+        self.damage[i] = damage
+        self.kind[i] = kind
+        self.alive[i] = True
+        self.count = i + 1
+        self.max_speed = max(self.max_speed, math.hypot(vx, vy))
+        if self.analytic:
+            self._track(i, i + 1)
+
+    def spawn_batch(self, x, y, vx, vy, kind, damage=1, lead=0.0):
+        if lead:
+            x = x + vx * lead
+            y = y + vy * lead
+        i = self.count
+        j = i + len(vx)
+        if j > self.capacity:
+            self._grow(j)
+        self.x[i:j] = x
+        self.y[i:j] = y
+        self.px[i:j] = x
+        self.py[i:j] = y
+        self.vx[i:j] = vx
+        self.vy[i:j] = vy
+        self.damage[i:j] = damage
+        self.kind[i:j] = kind
+        self.alive[i:j] = True
+        self.count = j
+        if j > i:
+            vx = self.vx[i:j]
+            vy = self.vy[i:j]
+            self.max_speed = max(self.max_speed, float(np.sqrt(vx * vx + vy * vy).max()))
+        if self.analytic:
+            self._track(i, j)
+
+    def clear(self):
+        self.count = 0
+        self.dead = 0
+        self.epoch += 1
+        self.max_speed = 0.0
+        self.expiry.clear()
+        self.row_of.clear()
 
     def update(self, dt):
-        self.x += self.vx * dt
-        self.y += self.vy * dt
-        if (
-            self.x < -40
-            or self.x > WIDTH + 40
-            or self.y < -60
-            or self.y > HEIGHT + 60
-        ):
-            self.dead = True
+        if self.analytic:
+            self.t += dt
+            self.tick += 1
+            self.last_dt = dt
+            expiry = self.expiry
+            while expiry and expiry[0][0] < self.t:
+                row = self.row_of.get(heapq.heappop(expiry)[1])
+                if row is not None and self.alive[row]:
+                    self.alive[row] = False
+                    self.dead += 1
+            return
+        n = self.count
+        x = self.x[:n]
+        y = self.y[:n]
+        self.px[:n] = x
+        self.py[:n] = y
+        x += self.vx[:n] * dt
+        y += self.vy[:n] * dt
+        self.alive[:n] &= (
+            (x >= -CULL_MARGIN_X) & (x <= WIDTH + CULL_MARGIN_X) & (y >= -CULL_MARGIN_Y) & (y <= HEIGHT + CULL_MARGIN_Y)
+        )
+
+    def positions(self, idx):
+        if not self.analytic:
+            return self.x[idx], self.y[idx]
+        age = self.t - self.t0[idx]
+        return self.ox[idx] + self.vx[idx] * age, self.oy[idx] + self.vy[idx] * age
+
+    def segments(self, idx):
+        if not self.analytic:
+            return self.px[idx], self.py[idx], self.x[idx], self.y[idx]
+        age = self.t - self.t0[idx]
+        prev = np.maximum(age - self.last_dt, 0.0)
+        ox = self.ox[idx]
+        oy = self.oy[idx]
+        vx = self.vx[idx]
+        vy = self.vy[idx]
+        return ox + vx * prev, oy + vy * prev, ox + vx * age, oy + vy * age
+
+    def radii(self, idx):
+        return KIND_RADIUS[self.kind[idx]]
+
+    def live(self):
+        if not self.dead:
+            return slice(0, self.count)
+        return np.flatnonzero(self.alive[: self.count])
+
+    def sync(self):
+        if not self.analytic or self.synced == self.tick:
+            return
+        n = self.count
+        age = self.t - self.t0[:n]
+        self.x[:n], self.y[:n] = self.positions(slice(0, n))
+        prev = np.maximum(age - self.last_dt, 0.0)
+        self.px[:n] = self.ox[:n] + self.vx[:n] * prev
+        self.py[:n] = self.oy[:n] + self.vy[:n] * prev
+        self.synced = self.tick
+
+    def index(self, grid):
+        if not self.analytic:
+            grid.rebuild(self)
+            return
+        if grid.epoch != self.epoch or self.tick - grid.tick >= GRID_REBUILD_TICKS:
+            self._swap_remove()
+            self.sync()
+            grid.rebuild(self)
+            grid.epoch = self.epoch
+            grid.tick = self.tick
+            grid.t = self.t
+        # Bullets keep moving after the rebuild, so widen queries by how far any
+        # of them can have travelled since.
+        grid.slack = self.max_speed * (self.t - grid.t)
+
+    def collide_circle(self, cx, cy, r, grid=None):
+        if grid is None:
+            n = self.count
+            x, y = self.positions(slice(0, n))
+            hit = np.flatnonzero(self.alive[:n] & (dist2(x, y, cx, cy) <= (self.radii(slice(0, n)) + r) ** 2))
+        else:
+            idx = self._candidates(grid, cx, cy, r)
+            x, y = self.positions(idx)
+            near = dist2(x, y, cx, cy) <= (self.radii(idx) + r) ** 2
+            hit = idx[self.alive[idx] & near]
+        if hit.size == 0:
+            return 0
+        self.alive[hit] = False
+        if self.analytic:
+            self.dead += hit.size
+        return int(self.damage[hit].sum())
+
+    def _candidates(self, grid, cx, cy, r):
+        idx = grid.query_circle(cx, cy, r + grid.max_radius + grid.slack)
+        if grid.indexed < self.count:
+            # Rows spawned since the last rebuild are not in the grid yet.
+            idx = np.concatenate((idx, np.arange(grid.indexed, self.count)))
+        return idx
+
+    def collide_swept(self, ax, ay, bx, by, r, dt, grid, limit):
+        # The target moves a -> b over the step while each bullet moves from its
+        # previous to its current position; test the whole segments so fast
+        # shots cannot tunnel at low tick rates.
+        half = 0.5 * math.hypot(bx - ax, by - ay)
+        idx = self._candidates(grid, 0.5 * (ax + bx), 0.5 * (ay + by), r + half + self.max_speed * dt)
+        idx = idx[self.alive[idx]]
+        if idx.size == 0:
+            return 0
+        x0, y0, x1, y1 = self.segments(idx)
+        # The gap d(t) = d0 + e * t is linear in t, so |d(t)|^2 - R^2 is the
+        # quadratic a t^2 + 2 b t + c. It reaches zero within the step if it
+        # starts or ends inside, or dips below zero at its vertex -b / a in (0, 1).
+        dx0 = x0 - ax
+        dy0 = y0 - ay
+        ex = x1 - bx - dx0
+        ey = y1 - by - dy0
+        rr = self.radii(idx) + r
+        a = ex * ex + ey * ey
+        b = dx0 * ex + dy0 * ey
+        c = dx0 * dx0 + dy0 * dy0 - rr * rr
+        hit = (c <= 0.0) | (a + 2.0 * b + c <= 0.0) | ((b < 0.0) & (-b < a) & (b * b >= a * c))
+        if not hit.any():
+            return 0
+        rows = idx[hit]
+        if rows.size > 1:
+            # Apply hits in time-of-impact order and stop once the target is out
+            # of hit points, so bullets arriving after the kill keep flying.
+            a = a[hit]
+            b = b[hit]
+            c = c[hit]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                toi = np.where(c <= 0.0, 0.0, (-b - np.sqrt(np.maximum(b * b - a * c, 0.0))) / a)
+            rows = rows[np.argsort(toi, kind="stable")]
+        dmg = np.cumsum(self.damage[rows])
+        rows = rows[: int(np.searchsorted(dmg, limit)) + 1]
+        self.alive[rows] = False
+        if self.analytic:
+            self.dead += rows.size
+        return int(dmg[rows.size - 1])
+
+    def compact(self):
+        if not self.analytic:
+            self._swap_remove()
+
+    def _swap_remove(self):
+        n = self.count
+        dead = np.flatnonzero(~self.alive[:n])
+        if dead.size == 0:
+            return
+        k = n - dead.size
+        # Swap-remove: survivors in the tail fill the holes left in the head.
+        holes = dead[dead < k]
+        if self.analytic:
+            for serial in self.serial[dead].tolist():
+                self.row_of.pop(serial, None)
+        if holes.size:
+            donors = k + np.flatnonzero(self.alive[k:n])
+            for name, _ in self.fields:
+                arr = getattr(self, name)
+                arr[holes] = arr[donors]
+            if self.analytic:
+                self.row_of.update(zip(self.serial[holes].tolist(), holes.tolist()))
+        self.count = k
+        self.dead = 0
+        self.epoch += 1
+
+
+GRID_CELL = 32
+
+
+class SpatialHash:
+    def __init__(self, cell=GRID_CELL):
+        self.cell = cell
+        self.cols = -(-WIDTH // cell)
+        self.rows = -(-HEIGHT // cell)
+        self.ncells = self.cols * self.rows
+        self.cell_start = np.zeros(self.ncells + 2, dtype=np.int64)
+        self.order = np.zeros(0, dtype=np.int64)
+        self.max_radius = 0.0
+        self.indexed = 0
+        self.slack = 0.0
+        self.epoch = -1
+        self.tick = 0
+        self.t = 0.0
+        self._empty = np.zeros(0, dtype=np.int64)
+
+    def _cell_xy(self, x, y):
+        cx = np.clip(x // self.cell, 0, self.cols - 1).astype(np.int64)
+        cy = np.clip(y // self.cell, 0, self.rows - 1).astype(np.int64)
+        return cx, cy
+
+    def rebuild(self, field):
+        n = field.count
+        cx, cy = self._cell_xy(field.x[:n], field.y[:n])
+        # Dead rows go to a sentinel cell past the grid so queries never see them.
+        ids = np.where(field.alive[:n], cy * self.cols + cx, self.ncells).astype(np.uint16)
+        self.order = np.argsort(ids, kind="stable")
+        counts = np.bincount(ids, minlength=self.ncells + 1)
+        np.cumsum(counts, out=self.cell_start[1:])
+        self.max_radius = float(field.radii(slice(0, n)).max()) if n else 0.0
+        self.indexed = n
+
+    def cells_for_circle(self, x, y, r):
+        c = self.cell
+        x0 = int(clamp((x - r) // c, 0, self.cols - 1))
+        x1 = int(clamp((x + r) // c, 0, self.cols - 1))
+        y0 = int(clamp((y - r) // c, 0, self.rows - 1))
+        y1 = int(clamp((y + r) // c, 0, self.rows - 1))
+        return x0, x1, y0, y1
+
+    def query_circle(self, x, y, r):
+        x0, x1, y0, y1 = self.cells_for_circle(x, y, r)
+        start = self.cell_start
+        # Cells are row-major, so each grid row of the query box is one contiguous run.
+        runs = [
+            self.order[start[row * self.cols + x0] : start[row * self.cols + x1 + 1]]
+            for row in range(y0, y1 + 1)
+        ]
+        runs = [run for run in runs if run.size]
+        if not runs:
+            return self._empty
+        if len(runs) == 1:
+            return runs[0]
+        return np.concatenate(runs)
+
+    def near_point(self, field, x, y, radius):
+        # Analytic bullets keep moving after a rebuild, so widen the query by the
+        # slack, add rows spawned since, and filter on current positions.
+        idx = self.query_circle(x, y, radius + self.slack)
+        if self.indexed < field.count:
+            idx = np.concatenate((idx, np.arange(self.indexed, field.count)))
+        idx = idx[field.alive[idx]]
+        px, py = field.positions(idx)
+        return idx[dist2(px, py, x, y) <= radius * radius]
 
 
 class HealPickup:
-    def __init__(self, x):
+    __slots__ = ("x", "y", "prev_y", "vy", "radius", "dead")
+
+    def __init__(self, x=0.0):
+        self.reset(x)
+
+    def reset(self, x):
         self.x = x
         self.y = -24
+        self.prev_y = self.y
         self.vy = HEAL_FALL_SPEED
         self.radius = HEAL_RADIUS
         self.dead = False
 
     def update(self, dt):
+        self.prev_y = self.y
         self.y += self.vy * dt
         if self.y > HEIGHT + 40:
             self.dead = True
 
 
-def spawn_player_bullets(player, bullets):
-    bullets.append(
-        Bullet(
-            player.x,
-            player.y - 12,
-            0.0,
-            -PLAYER_BULLET_SPEED,
-            PLAYER_BULLET_RADIUS,
-            True,
-            player.bullet_damage,
-        )
+class EntityPool:
+    def __init__(self, factory):
+        self.factory = factory
+        self.active = []
+        self.free = []
+
+    def __len__(self):
+        return len(self.active)
+
+    def __iter__(self):
+        return iter(self.active)
+
+    def acquire(self):
+        if self.free:
+            obj = self.free.pop()
+        else:
+            obj = self.factory()
+            ALLOCATIONS.total += 1
+        self.active.append(obj)
+        return obj
+
+    def clear(self):
+        self.free.extend(self.active)
+        self.active.clear()
+
+    def compact(self):
+        items = self.active
+        i = 0
+        while i < len(items):
+            obj = items[i]
+            if obj.dead:
+                last = items.pop()
+                if last is not obj:
+                    items[i] = last
+                self.free.append(obj)
+            else:
+                i += 1
+
+
+def spawn_player_bullets(player, bullets, lead=0.0, at=1.0):
+    # at is how far through the tick the shot left the muzzle; the ship moved
+    # from prev to its current position over the tick.
+    x = player.x if at == 1.0 else lerp(player.prev_x, player.x, at)
+    y = player.y if at == 1.0 else lerp(player.prev_y, player.y, at)
+    bullets.spawn(
+        x,
+        y - 12,
+        0.0,
+        -PLAYER_BULLET_SPEED,
+        KIND_PLAYER,
+        player.bullet_damage,
+        lead,
     )
 
 
-def spawn_heal_pickup(pickups):
-    x = random.uniform(24, WIDTH - 24)
-    pickups.append(HealPickup(x))
+def spawn_heal_pickup(pickups, rng):
+    x = rng.uniform(24, WIDTH - 24)
+    pickups.acquire().reset(x)
 
 
-def draw_heal_pickup(surface, p):
-    x = int(p.x)
-    y = int(p.y)
+def draw_heal_pickup(surface, x, y):
     s = 7
     w = 4
     green = (80, 230, 110)
@@ -225,92 +734,336 @@ def draw_heal_pickup(surface, p):
 
 
 def spawn_super_bullet(player, bullets):
-    bullets.append(
-        Bullet(
-            player.x,
-            player.y - 18,
-            0.0,
-            -SUPER_BULLET_SPEED,
-            SUPER_BULLET_RADIUS,
-            True,
-            player.super_damage,
-        )
+    bullets.spawn(
+        player.x,
+        player.y - 18,
+        0.0,
+        -SUPER_BULLET_SPEED,
+        KIND_SUPER,
+        player.super_damage,
     )
 
 
-def pattern_ring_burst(enemy, player, bullets, t_global, dt, level):
-    ring_period = max(0.95, 1.25 - level * 0.03)
-    if int(t_global / ring_period) != int((t_global - dt) / ring_period):
-        n = int(clamp(18 + level * 2, 18, 44))
-        base = t_global * 1.6
-        spd = ENEMY_BULLET_SPEED * (1.0 + 0.03 * level)
-        for i in range(n):
-            ang = base + (i / n) * math.tau
-            vx = math.cos(ang) * spd
-            vy = math.sin(ang) * spd
-            bullets.append(Bullet(enemy.x, enemy.y, vx, vy, ENEMY_BULLET_RADIUS, False, 1))
-
-
-def pattern_aimed_spread(enemy, player, bullets, t_global, dt, level):
-    aimed_period = max(0.22, 0.42 - level * 0.01)
-    if int(t_global / aimed_period) != int((t_global - dt) / aimed_period):
-        dx = player.x - enemy.x
-        dy = player.y - enemy.y
-        d = math.hypot(dx, dy)
-        if d > 0.001:
-            dx /= d
-            dy /= d
-        spread = 0.20
-        spd = ENEMY_BULLET_SPEED * (1.10 + 0.02 * level)
-        for s in (-spread, 0.0, spread):
-            ang = math.atan2(dy, dx) + s
-            vx = math.cos(ang) * spd
-            vy = math.sin(ang) * spd
-            bullets.append(Bullet(enemy.x, enemy.y, vx, vy, ENEMY_BULLET_RADIUS, False, 1))
-
-
-def pattern_spiral_stream(enemy, player, bullets, t_global, dt, level):
-    step_period = max(0.05, 0.09 - level * 0.002)
-    if int(t_global / step_period) != int((t_global - dt) / step_period):
-        ang = t_global * (2.2 + level * 0.12)
-        spd = ENEMY_BULLET_SPEED * (0.95 + 0.02 * level)
-        vx = math.cos(ang) * spd
-        vy = math.sin(ang) * spd
-        bullets.append(Bullet(enemy.x, enemy.y, vx, vy, ENEMY_BULLET_RADIUS, False, 1))
-
-
-def pattern_downward_rain(enemy, player, bullets, t_global, dt, level):
-    rain_period = max(0.10, 0.18 - level * 0.003)
-    if int(t_global / rain_period) != int((t_global - dt) / rain_period):
-        count = int(clamp(1 + level // 3, 1, 4))
-        for _ in range(count):
-            ang = math.pi * 0.5 + random.uniform(-0.55, 0.55)
-            spd = ENEMY_BULLET_SPEED * (0.95 + 0.02 * level)
-            vx = math.cos(ang) * spd
-            vy = math.sin(ang) * spd
-            bullets.append(Bullet(enemy.x, enemy.y, vx, vy, ENEMY_BULLET_RADIUS, False, 1))
+@functools.lru_cache(maxsize=None)
+def unit_circle(n):
+    ang = np.arange(n) / n * math.tau
+    table = np.stack((np.cos(ang), np.sin(ang)))
+    table.setflags(write=False)
+    return table
 
 
-PATTERN_POOL = [
-    ("Ring Burst", pattern_ring_burst),
-    ("Aimed Spread", pattern_aimed_spread),
-    ("Spiral Stream", pattern_spiral_stream),
-    ("Downward Rain", pattern_downward_rain),
-]
+def unit_offsets(offsets):
+    table = np.stack((np.cos(offsets), np.sin(offsets)))
+    table.setflags(write=False)
+    return table
 
 
-def choose_patterns(level):
-    n = int(clamp(1 + level // 2, 1, len(PATTERN_POOL)))
-    return random.sample(PATTERN_POOL, n)
+class SpawnPoint:
+    __slots__ = ("x", "y", "lead")
+
+    def __init__(self):
+        self.x = 0.0
+        self.y = 0.0
+        self.lead = 0.0
+
+
+def emit_rotated(origin, bullets, table, ang, spd):
+    # Rotating a precomputed (cos, sin) table by ang is one 2x2 product per shot.
+    c = math.cos(ang) * spd
+    s = math.sin(ang) * spd
+    cos_t, sin_t = table
+    bullets.spawn_batch(origin.x, origin.y, c * cos_t - s * sin_t, s * cos_t + c * sin_t, KIND_ENEMY, 1, origin.lead)
+
+
+class LevelCurve:
+    __slots__ = ("base", "slope", "every", "lo", "hi")
+
+    def __init__(self, base, slope=0.0, every=1, lo=None, hi=None):
+        self.base = base
+        self.slope = slope
+        self.every = every
+        self.lo = lo
+        self.hi = hi
+
+    def __call__(self, level):
+        v = self.base + self.slope * (level // self.every)
+        if self.lo is not None:
+            v = max(self.lo, v)
+        if self.hi is not None:
+            v = min(self.hi, v)
+        return v
+
+
+class SpinAngle:
+    def __init__(self, rate):
+        self.rate = rate
+
+    def compile(self, level, count):
+        return unit_circle(count), self.rate(level)
+
+    def emit(self, params, spd, origin, player, bullets, t, rng):
+        table, rate = params
+        emit_rotated(origin, bullets, table, t * rate, spd)
+
+
+class AimedAngle:
+    def __init__(self, offsets):
+        self.table = unit_offsets(np.array(offsets))
+
+    def compile(self, level, count):
+        return self.table
+
+    def emit(self, params, spd, origin, player, bullets, t, rng):
+        ang = math.atan2(player.y - origin.y, player.x - origin.x)
+        emit_rotated(origin, bullets, params, ang, spd)
+
+
+class RandomAngle:
+    def __init__(self, center, half_width):
+        self.center = center
+        self.half_width = half_width
+
+    def compile(self, level, count):
+        return count
+
+    def emit(self, params, spd, origin, player, bullets, t, rng):
+        hw = self.half_width
+        ang = np.array([self.center + rng.uniform(-hw, hw) for _ in range(params)])
+        bullets.spawn_batch(origin.x, origin.y, np.cos(ang) * spd, np.sin(ang) * spd, KIND_ENEMY, 1, origin.lead)
+
+
+class Emitter:
+    __slots__ = ("dx", "dy")
+
+    def __init__(self, dx=0.0, dy=0.0):
+        self.dx = dx
+        self.dy = dy
+
+
+BOSS_EMITTER = Emitter()
+
+
+class PatternSpec:
+    def __init__(self, name, period, speed, angle, count=LevelCurve(1), emitter=BOSS_EMITTER):
+        self.name = name
+        self.period = period
+        self.speed = speed
+        self.angle = angle
+        self.count = count
+        self.emitter = emitter
+
 
+class CompiledPattern:
+    __slots__ = ("name", "angle", "period", "speed", "params", "dx", "dy")
 
-def spawn_enemy_patterns(enemy, player, bullets, t_global, dt, level, patterns):
-    for _, fn in patterns:
-        fn(enemy, player, bullets, t_global, dt, level)
+    def __init__(self, spec, level):
+        self.name = spec.name
+        self.angle = spec.angle
+        self.dx = spec.emitter.dx
+        self.dy = spec.emitter.dy
+        self.period = spec.period(level)
+        self.speed = ENEMY_BULLET_SPEED * spec.speed(level)
+        self.params = spec.angle.compile(level, int(spec.count(level)))
+
+    def emit(self, origin, player, bullets, t, rng):
+        self.angle.emit(self.params, self.speed, origin, player, bullets, t, rng)
+
+
+PATTERN_POOL = [
+    PatternSpec(
+        "Ring Burst",
+        period=LevelCurve(1.25, -0.03, lo=0.95),
+        speed=LevelCurve(1.0, 0.03),
+        angle=SpinAngle(LevelCurve(1.6)),
+        count=LevelCurve(18, 2, lo=18, hi=44),
+    ),
+    PatternSpec(
+        "Aimed Spread",
+        period=LevelCurve(0.42, -0.01, lo=0.22),
+        speed=LevelCurve(1.10, 0.02),
+        angle=AimedAngle((-0.20, 0.0, 0.20)),
+    ),
+    PatternSpec(
+        "Spiral Stream",
+        period=LevelCurve(0.09, -0.002, lo=0.05),
+        speed=LevelCurve(0.95, 0.02),
+        angle=SpinAngle(LevelCurve(2.2, 0.12)),
+    ),
+    PatternSpec(
+        "Downward Rain",
+        period=LevelCurve(0.18, -0.003, lo=0.10),
+        speed=LevelCurve(0.95, 0.02),
+        angle=RandomAngle(math.pi * 0.5, 0.55),
+        count=LevelCurve(1, 1, every=3, lo=1, hi=4),
+    ),
+]
+
+SCHEDULE_HORIZON = 30.0
+
+
+class PatternSchedule:
+    def __init__(self, specs, level, horizon=SCHEDULE_HORIZON):
+        self.patterns = [CompiledPattern(spec, level) for spec in specs]
+        self.horizon = horizon
+        self.origin = SpawnPoint()
+        self.seek(0.0)
+
+    def seek(self, t):
+        self.t_end = t
+        self.times = np.zeros(0)
+        self.which = np.zeros(0, dtype=np.int64)
+        self.cursor = 0
+        self._extend()
+        self.cursor = int(np.searchsorted(self.times, t, side="right"))
+
+    def _extend(self):
+        t0 = self.t_end
+        t1 = t0 + self.horizon
+        times = [self.times[self.cursor :]]
+        which = [self.which[self.cursor :]]
+        for i, p in enumerate(self.patterns):
+            # Shot k of a pattern fires on the first tick at or after k * period, k >= 1.
+            k = np.arange(math.floor(t0 / p.period) + 1, math.floor(t1 / p.period) + 1)
+            times.append(k * p.period)
+            which.append(np.full(k.size, i, dtype=np.int64))
+        times = np.concatenate(times)
+        which = np.concatenate(which)
+        order = np.argsort(times, kind="stable")
+        self.times = times[order]
+        self.which = which[order]
+        self.cursor = 0
+        self.t_end = t1
+
+    def advance(self, t, enemy, player, bullets, rng, dt=None):
+        if not self.patterns:
+            return
+        origin = self.origin
+        boss_x = enemy.x
+        origin.lead = 0.0
+        while True:
+            if self.cursor >= self.times.size:
+                self._extend()
+                continue
+            te = self.times[self.cursor]
+            if te > t:
+                return
+            if dt is None:
+                te = t
+            else:
+                # Fire from where the boss was at the scheduled time, placed so
+                # that after this tick's update the volley has flown t - te.
+                te = float(te)
+                boss_x = enemy.x_at(te)
+                origin.lead = t - te - dt
+            pattern = self.patterns[self.which[self.cursor]]
+            origin.x = boss_x + pattern.dx
+            origin.y = enemy.y + pattern.dy
+            pattern.emit(origin, player, bullets, te, rng)
+            self.cursor += 1
+
+
+def choose_patterns(level, rng):
+    n = int(clamp(1 + level // 2, 1, len(PATTERN_POOL)))
+    return rng.sample(PATTERN_POOL, n)
+
+
+def spawn_enemy_patterns(enemy, player, bullets, t_global, schedule, rng, dt=None):
+    schedule.advance(t_global, enemy, player, bullets, rng, dt)
+
+
+TEXT_CACHE_SIZE = 256
+
+
+class TextCache:
+    def __init__(self, max_entries=TEXT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, antialias, color):
+        key = (font, text, antialias, color)
+        img = self.entries.get(key)
+        if img is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return img
+        self.misses += 1
+        img = font.render(text, antialias, color)
+        self.entries[key] = img
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return img
+
+    def hit_rate(self):
+        return self.hits / max(self.hits + self.misses, 1)
+
+
+TEXT_CACHE = TextCache()
+
+CACHE_HOME = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+FONT_CACHE_PATH = os.path.join(CACHE_HOME, "bullet-hell", "fonts.json")
+
+
+class FontBook:
+    def __init__(self, name=None, cache_path=FONT_CACHE_PATH):
+        self.name = name
+        self.cache_path = cache_path
+        self.path = None
+        self.resolved = name is None
+        self.fonts = {}
+
+    def resolve(self):
+        # match_font() shells out to fc-list and scans every installed font, so the
+        # path it finds is remembered across launches.
+        try:
+            with open(self.cache_path) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+        path = cache.get(self.name)
+        if path is None or not os.path.exists(path):
+            path = pygame.font.match_font(self.name)
+            if path is not None:
+                cache[self.name] = path
+                try:
+                    os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+                    with open(self.cache_path, "w") as f:
+                        json.dump(cache, f, indent=2)
+                except OSError:
+                    pass
+        self.path = path
+        self.resolved = True
+
+    def get(self, size):
+        font = self.fonts.get(size)
+        if font is None:
+            if not self.resolved:
+                self.resolve()
+            font = pygame.font.Font(self.path, size)
+            self.fonts[size] = font
+        return font
+
+
+class HudLabel:
+    def __init__(self, fmt, pos, color=(235, 235, 235)):
+        self.fmt = fmt
+        self.pos = pos
+        self.color = color
+        self.font = None
+        self.values = None
+        self.img = None
+
+    def draw(self, surface, font, *values):
+        if values != self.values or font is not self.font:
+            self.img = font.render(self.fmt.format(*values), True, self.color)
+            self.font = font
+            self.values = values
+        surface.blit(self.img, self.pos)
 
 
 def draw_text_center(surface, font, text, y, color):
-    img = font.render(text, True, color)
+    img = TEXT_CACHE.render(font, text, True, color)
     rect = img.get_rect(center=(WIDTH // 2, int(y)))
     surface.blit(img, rect)
 
@@ -329,7 +1082,7 @@ def draw_button(surface, font, rect, text, enabled=True):
 
     pygame.draw.rect(surface, bg, rect, border_radius=10)
     pygame.draw.rect(surface, border, rect, width=2, border_radius=10)
-    img = font.render(text, True, fg)
+    img = TEXT_CACHE.render(font, text, True, fg)
     surface.blit(img, img.get_rect(center=rect.center))
     return hovered
 
@@ -343,8 +1096,8 @@ UPGRADE_POOL = [
 ]
 
 
-def roll_upgrades():
-    return random.sample(UPGRADE_POOL, 3)
+def roll_upgrades(rng):
+    return rng.sample(UPGRADE_POOL, 3)
 
 
 def apply_upgrade(player, upgrade_id):
@@ -361,331 +1114,1285 @@ def apply_upgrade(player, upgrade_id):
         player.hp = min(player.max_hp, player.hp + 5)
 
 
-def boss_hp_for_level(base_boss_hp, level):
-    return int(round(base_boss_hp * (BOSS_HP_GROWTH ** (level - 1))))
-
-
-def reset_run(player, enemy, base_boss_hp, heal_interval):
-    player.reset_for_new_run()
-    enemy.reset()
-    level = 1
-    boss_max_hp = boss_hp_for_level(base_boss_hp, level)
-    boss_hp = boss_max_hp
-    patterns = choose_patterns(level)
-    return [], [], [], 0.0, level, boss_hp, boss_max_hp, heal_interval, heal_interval, patterns
-
-
-def start_next_level(player, enemy, base_boss_hp, heal_interval, level):
-    player.reset_position()
-    enemy.reset()
-    boss_max_hp = boss_hp_for_level(base_boss_hp, level)
-    boss_hp = boss_max_hp
-    patterns = choose_patterns(level)
-    return [], [], [], 0.0, boss_hp, boss_max_hp, heal_interval, patterns
-
-
-def main():
-    pygame.init()
-    pygame.display.set_caption("Bullet Hell")
-    screen = pygame.display.set_mode((WIDTH, HEIGHT))
-    clock = pygame.time.Clock()
-
-    font = pygame.font.SysFont(None, 28)
-    big_font = pygame.font.SysFont(None, 72)
-    menu_font = pygame.font.SysFont(None, 44)
-
-    player = Player()
-    enemy = Enemy()
-
-    player_bullets = []
-    enemy_bullets = []
-    heal_pickups = []
-    t_global = 0.0
-    difficulty = DEFAULT_DIFFICULTY
-    base_boss_hp = DIFFICULTIES[difficulty]["boss_hp"]
-    heal_interval = DIFFICULTIES[difficulty]["heal_interval"]
-    heal_spawn_timer = heal_interval
-    level = 1
-    boss_max_hp = boss_hp_for_level(base_boss_hp, level)
-    boss_hp = boss_max_hp
-    patterns = choose_patterns(level)
-
-    upgrade_choices = []
-
-    player_color_idx = 0
-    enemy_color_idx = 4
-    player_color = COLOR_PALETTE[player_color_idx]
-    enemy_color = COLOR_PALETTE[enemy_color_idx]
-
-    state = "menu"
-
-    running = True
-    while running:
-        dt = clock.tick(FPS) / 1000.0
-        dt = min(dt, 1.0 / 20.0)
-
-        play_rect = pygame.Rect(WIDTH // 2 - 140, int(HEIGHT * 0.46), 280, 56)
-        options_rect = pygame.Rect(WIDTH // 2 - 140, int(HEIGHT * 0.56), 280, 56)
-        quit_rect = pygame.Rect(WIDTH // 2 - 140, int(HEIGHT * 0.66), 280, 56)
-
-        opt_back_rect = pygame.Rect(18, 18, 120, 44)
-        p_left = pygame.Rect(WIDTH // 2 + 40, int(HEIGHT * 0.36), 46, 46)
-        p_right = pygame.Rect(WIDTH // 2 + 200, int(HEIGHT * 0.36), 46, 46)
-        e_left = pygame.Rect(WIDTH // 2 + 40, int(HEIGHT * 0.48), 46, 46)
-        e_right = pygame.Rect(WIDTH // 2 + 200, int(HEIGHT * 0.48), 46, 46)
-        p_swatch = pygame.Rect(WIDTH // 2 + 100, int(HEIGHT * 0.36), 90, 46)
-        e_swatch = pygame.Rect(WIDTH // 2 + 100, int(HEIGHT * 0.48), 90, 46)
-
-        diff_easy = pygame.Rect(WIDTH // 2 - 200, int(HEIGHT * 0.62), 120, 50)
-        diff_normal = pygame.Rect(WIDTH // 2 - 60, int(HEIGHT * 0.62), 120, 50)
-        diff_hard = pygame.Rect(WIDTH // 2 + 80, int(HEIGHT * 0.62), 120, 50)
-
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
-                    if state in ("upgrade",):
-                        state = "menu"
-                    else:
-                        running = False
-                if event.key == pygame.K_p and state in ("playing", "paused"):
-                    state = "paused" if state == "playing" else "playing"
-                if event.key == pygame.K_x and state == "playing":
-                    if boss_hp > 0 and player.can_super():
-                        spawn_super_bullet(player, player_bullets)
-                        player.use_super()
-                if state == "upgrade" and event.key in (pygame.K_1, pygame.K_2, pygame.K_3):
-                    idx = event.key - pygame.K_1
-                    if 0 <= idx < len(upgrade_choices):
-                        apply_upgrade(player, upgrade_choices[idx][0])
-                        level += 1
-                        (
-                            player_bullets,
-                            enemy_bullets,
-                            heal_pickups,
-                            t_global,
-                            boss_hp,
-                            boss_max_hp,
-                            heal_spawn_timer,
-                            patterns,
-                        ) = start_next_level(player, enemy, base_boss_hp, heal_interval, level)
-                        state = "playing"
-                if state == "game_over" and event.key == pygame.K_r:
-                    (
-                        player_bullets,
-                        enemy_bullets,
-                        heal_pickups,
-                        t_global,
-                        level,
-                        boss_hp,
-                        boss_max_hp,
-                        heal_interval,
-                        heal_spawn_timer,
-                        patterns,
-                    ) = reset_run(player, enemy, base_boss_hp, heal_interval)
-                    state = "playing"
-            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                mx, my = event.pos
-                if state == "menu":
-                    if play_rect.collidepoint(mx, my):
-                        (
-                            player_bullets,
-                            enemy_bullets,
-                            heal_pickups,
-                            t_global,
-                            level,
-                            boss_hp,
-                            boss_max_hp,
-                            heal_interval,
-                            heal_spawn_timer,
-                            patterns,
-                        ) = reset_run(player, enemy, base_boss_hp, heal_interval)
-                        state = "playing"
-                    elif options_rect.collidepoint(mx, my):
-                        state = "options"
-                    elif quit_rect.collidepoint(mx, my):
-                        running = False
-                elif state == "options":
-                    if opt_back_rect.collidepoint(mx, my):
-                        state = "menu"
-                    elif p_left.collidepoint(mx, my):
-                        player_color_idx = (player_color_idx - 1) % len(COLOR_PALETTE)
-                        player_color = COLOR_PALETTE[player_color_idx]
-                    elif p_right.collidepoint(mx, my):
-                        player_color_idx = (player_color_idx + 1) % len(COLOR_PALETTE)
-                        player_color = COLOR_PALETTE[player_color_idx]
-                    elif e_left.collidepoint(mx, my):
-                        enemy_color_idx = (enemy_color_idx - 1) % len(COLOR_PALETTE)
-                        enemy_color = COLOR_PALETTE[enemy_color_idx]
-                    elif e_right.collidepoint(mx, my):
-                        enemy_color_idx = (enemy_color_idx + 1) % len(COLOR_PALETTE)
-                        enemy_color = COLOR_PALETTE[enemy_color_idx]
-                    elif diff_easy.collidepoint(mx, my):
-                        difficulty = "easy"
-                    elif diff_normal.collidepoint(mx, my):
-                        difficulty = "normal"
-                    elif diff_hard.collidepoint(mx, my):
-                        difficulty = "hard"
-
-                    boss_max_hp = DIFFICULTIES[difficulty]["boss_hp"]
-                    heal_interval = DIFFICULTIES[difficulty]["heal_interval"]
-                    base_boss_hp = DIFFICULTIES[difficulty]["boss_hp"]
-
-                elif state == "upgrade":
-                    up_rects = [
-                        pygame.Rect(WIDTH // 2 - 240, int(HEIGHT * 0.42), 480, 56),
-                        pygame.Rect(WIDTH // 2 - 240, int(HEIGHT * 0.52), 480, 56),
-                        pygame.Rect(WIDTH // 2 - 240, int(HEIGHT * 0.62), 480, 56),
-                    ]
-                    for i, r in enumerate(up_rects):
-                        if r.collidepoint(mx, my) and i < len(upgrade_choices):
-                            apply_upgrade(player, upgrade_choices[i][0])
-                            level += 1
-                            (
-                                player_bullets,
-                                enemy_bullets,
-                                heal_pickups,
-                                t_global,
-                                boss_hp,
-                                boss_max_hp,
-                                heal_spawn_timer,
-                                patterns,
-                            ) = start_next_level(player, enemy, base_boss_hp, heal_interval, level)
-                            state = "playing"
-                            break
-
-        keys = pygame.key.get_pressed()
-
-        if state == "playing":
-            t_global += dt
-            player.update(dt, keys)
-            enemy.update(dt)
-
-            heal_spawn_timer -= dt
-            if heal_spawn_timer <= 0.0:
-                spawn_heal_pickup(heal_pickups)
-                heal_spawn_timer = heal_interval
-
-            if (keys[pygame.K_z] or keys[pygame.K_SPACE]) and player.can_shoot():
-                player.shoot()
-                spawn_player_bullets(player, player_bullets)
-
-            if boss_hp > 0:
-                spawn_enemy_patterns(enemy, player, enemy_bullets, t_global, dt, level, patterns)
-
-            for b in player_bullets:
-                b.update(dt)
-                if not b.dead:
-                    if dist2(b.x, b.y, enemy.x, enemy.y) <= (b.radius + ENEMY_RADIUS) ** 2:
-                        b.dead = True
-                        boss_hp = max(0, boss_hp - b.damage)
-
-            for b in enemy_bullets:
-                b.update(dt)
-                if not b.dead:
-                    if dist2(b.x, b.y, player.x, player.y) <= (b.radius + PLAYER_RADIUS) ** 2:
-                        b.dead = True
-                        player.hp = max(0, player.hp - 1)
-
-            for p in heal_pickups:
-                p.update(dt)
-                if not p.dead:
-                    if dist2(p.x, p.y, player.x, player.y) <= (p.radius + PLAYER_RADIUS) ** 2:
-                        p.dead = True
-                        player.hp = min(player.max_hp, player.hp + HEAL_AMOUNT)
-
-            player_bullets = [b for b in player_bullets if not b.dead]
-            enemy_bullets = [b for b in enemy_bullets if not b.dead]
-            heal_pickups = [p for p in heal_pickups if not p.dead]
-
-            if boss_hp <= 0:
-                state = "upgrade"
-                upgrade_choices = roll_upgrades()
-                enemy_bullets = []
-                heal_pickups = []
-
-            if player.hp <= 0:
-                state = "game_over"
-
-        screen.fill((10, 10, 14))
-
-        if state == "menu":
-            draw_text_center(screen, big_font, "BULLET HELL", HEIGHT * 0.26, (235, 235, 235))
-            draw_text_center(screen, font, "Z/Space: Shoot   X: Super   P: Pause", HEIGHT * 0.34, (200, 200, 210))
-            draw_button(screen, menu_font, play_rect, "PLAY")
-            draw_button(screen, menu_font, options_rect, "OPTIONS")
-            draw_button(screen, menu_font, quit_rect, "QUIT")
-            pygame.display.flip()
-            continue
-
-        if state == "options":
-            draw_text_center(screen, big_font, "OPTIONS", HEIGHT * 0.20, (235, 235, 235))
+def boss_hp_for_level(base_boss_hp, level, growth=BOSS_HP_GROWTH):
+    return int(round(base_boss_hp * (growth ** (level - 1))))
+
+
+PROFILE_PHASES = ("events", "update", "patterns", "collision", "render", "present")
+PHASE_EVENTS = 0
+PHASE_UPDATE = 1
+PHASE_PATTERNS = 2
+PHASE_COLLISION = 3
+PHASE_RENDER = 4
+PHASE_PRESENT = 5
+PROFILE_COUNTS = ("player_bullets", "enemy_bullets", "heal_pickups")
+PROFILE_WINDOW = 240
+PROFILE_BUDGET_MS = 1000.0 / FPS
+
+
+class FrameProfiler:
+    def __init__(self, window=PROFILE_WINDOW):
+        self.window = window
+        self.show_overlay = False
+        self.stream = None
+        self.frame = 0
+        self.phase_ns = [0] * len(PROFILE_PHASES)
+        # Rolling window: one row per phase plus a final row for the whole frame.
+        self.ms = np.zeros((len(PROFILE_PHASES) + 1, window))
+        self.counts = np.zeros((len(PROFILE_COUNTS), window), dtype=np.int64)
+        self.frame_start = 0
+        self.last_ms = 0.0
+        self.overlay_text = []
+
+    def open_stream(self, path):
+        self.stream = open(path, "w")
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    def begin_frame(self):
+        self.frame_start = time.perf_counter_ns()
+        for i in range(len(self.phase_ns)):
+            self.phase_ns[i] = 0
+
+    def add(self, phase, ns):
+        self.phase_ns[phase] += ns
+
+    def end_frame(self, game):
+        total = time.perf_counter_ns() - self.frame_start
+        self.last_ms = total / 1e6
+        slot = self.frame % self.window
+        # step() times patterns and collision itself; report update exclusive of both.
+        update = self.phase_ns[PHASE_UPDATE] - self.phase_ns[PHASE_PATTERNS] - self.phase_ns[PHASE_COLLISION]
+        self.phase_ns[PHASE_UPDATE] = max(0, update)
+        for i, ns in enumerate(self.phase_ns):
+            self.ms[i, slot] = ns / 1e6
+        self.ms[-1, slot] = total / 1e6
+        counts = (len(game.player_bullets), len(game.enemy_bullets), len(game.heal_pickups))
+        self.counts[:, slot] = counts
+        if self.stream is not None:
+            record = {"frame": self.frame, "total_ms": total / 1e6}
+            record.update((name, ns / 1e6) for name, ns in zip(PROFILE_PHASES, self.phase_ns))
+            record.update(zip(PROFILE_COUNTS, counts))
+            record["allocations"] = ALLOCATIONS.total - ALLOCATIONS.frame_start
+            self.stream.write(json.dumps(record) + "\n")
+        self.frame += 1
+
+    def percentiles(self):
+        filled = min(self.frame, self.window)
+        if filled == 0:
+            return np.zeros((3, len(PROFILE_PHASES) + 1))
+        return np.percentile(self.ms[:, :filled], (50, 95, 99), axis=1)
+
+    def draw_overlay(self, surface, font, governor=None):
+        if self.frame % 15 == 0 or not self.overlay_text:
+            p50, p95, p99 = self.percentiles()
+            names = PROFILE_PHASES + ("frame",)
+            lines = ["ms: p50 / p95 / p99"]
+            lines += [f"{name:>9} {a:6.2f} {b:6.2f} {c:6.2f}" for name, a, b, c in zip(names, p50, p95, p99)]
+            slot = (self.frame - 1) % self.window
+            lines.append("  ".join(f"{name}={self.counts[i, slot]}" for i, name in enumerate(PROFILE_COUNTS)))
+            text = TEXT_CACHE
+            lines.append(
+                f"allocations/frame={ALLOCATIONS.last_frame}  "
+                f"text cache {text.hits}/{text.hits + text.misses} hits ({text.hit_rate():.0%})"
+            )
+            if governor is not None:
+                lines.append(
+                    f"drawn={governor.drawn_total}  skipped={governor.skipped_total}  "
+                    f"render {'cheap' if governor.cheap else 'full'}"
+                )
+            self.overlay_text = [font.render(line, True, (235, 235, 160)) for line in lines]
+
+        box = pygame.Rect(WIDTH - 16 - self.window, 110, self.window, 80)
+        pygame.draw.rect(surface, (20, 20, 28), box)
+        pygame.draw.rect(surface, (90, 90, 110), box, width=1)
+        scale = box.height / (2.0 * PROFILE_BUDGET_MS)
+        budget_y = box.bottom - int(PROFILE_BUDGET_MS * scale)
+        pygame.draw.line(surface, (200, 80, 80), (box.left, budget_y), (box.right - 1, budget_y))
+        filled = min(self.frame, self.window)
+        if filled > 1:
+            order = (np.arange(self.frame - filled, self.frame)) % self.window
+            heights = np.minimum(self.ms[-1, order] * scale, box.height - 1).astype(int)
+            xs = box.right - filled + np.arange(filled)
+            points = np.column_stack((xs, box.bottom - 1 - heights)).tolist()
+            pygame.draw.lines(surface, (120, 255, 140), False, points)
+
+        y = box.bottom + 6
+        for img in self.overlay_text:
+            surface.blit(img, (box.left - 90, y))
+            y += img.get_height()
+
+
+PROFILER = FrameProfiler()
+
+MAX_FRAME_SKIP = 4
+MAX_BACKLOG_S = 0.25
+GOVERNOR_SMOOTHING = 0.05
+CHEAP_ON_SKIP_RATE = 0.3
+CHEAP_OFF_HEADROOM = 0.85
+CHEAP_PROBE_FRAMES = 30
+CHEAP_PROBE_SMOOTHING = 0.25
+
+
+class FrameGovernor:
+    def __init__(self, target_ms=1000.0 / FPS, adaptive=False):
+        self.target_ms = target_ms
+        self.fps = 1000.0 / target_ms
+        self.adaptive = adaptive
+        self.frame_start = None
+        self.debt_ms = 0.0
+        self.skipped = 0
+        self.last_skipped = False
+        self.skip_rate = 0.0
+        self.work_ms = 0.0
+        self.render_ms_full = 0.0
+        self.render_ms_cheap = 0.0
+        self.cheap = False
+        self.render_cheap = False
+        self.cheap_drawn = 0
+        self.drawn_total = 0
+        self.skipped_total = 0
+
+    def tick(self, clock):
+        if self.frame_start is not None:
+            self._account((time.perf_counter() - self.frame_start) * 1000.0)
+        dt = clock.tick(self.fps) / 1000.0
+        self.frame_start = time.perf_counter()
+        return dt
+
+    def _account(self, work_ms):
+        self.work_ms += (work_ms - self.work_ms) * GOVERNOR_SMOOTHING
+        # Frame-time debt: how far behind the target the recent frames ran.
+        self.debt_ms = clamp(self.debt_ms + work_ms - self.target_ms, 0.0, MAX_FRAME_SKIP * self.target_ms)
+        self.skip_rate += (self.last_skipped - self.skip_rate) * GOVERNOR_SMOOTHING
+        self.last_skipped = False
+        if not self.adaptive:
+            return
+        if not self.cheap and self.skip_rate > CHEAP_ON_SKIP_RATE:
+            self.cheap = True
+        elif self.cheap:
+            # Only go back to full effects once they are known to fit the budget.
+            full = self.work_ms - self.render_ms_cheap + self.render_ms_full
+            if full < self.target_ms * CHEAP_OFF_HEADROOM:
+                self.cheap = False
+                self.cheap_drawn = 0
+
+    def max_steps(self, sim_hz):
+        if not self.adaptive:
+            return max_sim_steps(sim_hz)
+        return max(max_sim_steps(sim_hz), int(MAX_BACKLOG_S * sim_hz))
+
+    def should_draw(self):
+        if not self.adaptive or self.debt_ms <= 0.0 or self.skipped >= MAX_FRAME_SKIP:
+            self.skipped = 0
+            self.drawn_total += 1
+            # While cheap, draw an occasional full frame so render_ms_full keeps
+            # tracking what full effects cost now.
+            self.render_cheap = self.cheap
+            if self.cheap:
+                self.cheap_drawn += 1
+                if self.cheap_drawn >= CHEAP_PROBE_FRAMES:
+                    self.cheap_drawn = 0
+                    self.render_cheap = False
+            return True
+        self.skipped += 1
+        self.skipped_total += 1
+        self.last_skipped = True
+        return False
+
+    def add_render(self, ms):
+        if self.render_cheap:
+            self.render_ms_cheap += (ms - self.render_ms_cheap) * GOVERNOR_SMOOTHING
+        elif self.cheap:
+            self.render_ms_full += (ms - self.render_ms_full) * CHEAP_PROBE_SMOOTHING
+        else:
+            self.render_ms_full += (ms - self.render_ms_full) * GOVERNOR_SMOOTHING
+
+
+GC_YOUNG_LIMIT = 20000
+
+
+class GcControl:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.pending = False
+        self.collections = 0
+
+    def start(self):
+        if not self.enabled:
+            return
+        # Everything loaded so far lives for the whole session; freezing it keeps
+        # later full collections from walking it again.
+        gc.collect()
+        gc.freeze()
+
+    def enter(self, gameplay):
+        if not self.enabled:
+            return
+        if gameplay:
+            gc.disable()
+            self.pending = False
+        else:
+            gc.enable()
+            self.pending = True
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        if self.pending:
+            # Static screens cost next to nothing per frame, so a full collection
+            # right after one is shown is invisible.
+            gc.collect()
+            self.pending = False
+            self.collections += 1
+        elif not gc.isenabled() and gc.get_count()[0] > GC_YOUNG_LIMIT:
+            # Safety valve for long stretches of play: young generations only,
+            # which stays well under a millisecond.
+            gc.collect(1)
+            self.collections += 1
+
+
+HITCH_TOP_SITES = 3
+HITCH_TRACE_EVERY_S = 5.0
+HITCH_TRACE_FRAMES = 30
+
+
+class HitchDetector:
+    def __init__(self, path, budget_ms, gc_control, trace=False):
+        self.budget_ms = budget_ms
+        self.gc_control = gc_control
+        self.stream = sys.stderr if path == "-" else open(path, "w")
+        self.gc_ns = 0
+        self.gc_runs = [0, 0, 0]
+        self.gc_start = 0
+        self.skip = False
+        self.hitches = 0
+        self.trace = trace
+        self.tracing = False
+        self.trace_frames = 0
+        self.next_trace = time.perf_counter()
+        self.baseline = None
+        self.last_blocks = sys.getallocatedblocks()
+        gc.callbacks.append(self._on_gc)
+
+    def _on_gc(self, phase, info):
+        if phase == "start":
+            self.gc_start = time.perf_counter_ns()
+        else:
+            self.gc_ns += time.perf_counter_ns() - self.gc_start
+            self.gc_runs[info["generation"]] += 1
+
+    def end_frame(self, profiler, game):
+        blocks = sys.getallocatedblocks()
+        if profiler.last_ms > self.budget_ms and not self.skip:
+            self.log(profiler, game, blocks - self.last_blocks)
+            # Writing the record, and the allocation snapshot when tracing, can
+            # push the next frame over budget too; don't report that one.
+            self.skip = True
+        else:
+            self.skip = False
+        if self.trace:
+            self.step_trace()
+        self.last_blocks = sys.getallocatedblocks()
+        self.gc_ns = 0
+        self.gc_runs[0] = self.gc_runs[1] = self.gc_runs[2] = 0
+
+    def step_trace(self):
+        # tracemalloc slows every allocation down several times over, so it runs
+        # only for a short window every few seconds. Hitches inside a window get
+        # their allocation sites logged.
+        import tracemalloc
+
+        if self.tracing:
+            self.trace_frames += 1
+            if self.trace_frames >= HITCH_TRACE_FRAMES:
+                tracemalloc.stop()
+                self.tracing = False
+                self.baseline = None
+        elif time.perf_counter() >= self.next_trace:
+            tracemalloc.start()
+            self.baseline = tracemalloc.take_snapshot()
+            self.tracing = True
+            self.trace_frames = 0
+            self.next_trace = time.perf_counter() + HITCH_TRACE_EVERY_S
+
+    def log(self, profiler, game, blocks):
+        self.hitches += 1
+        record = {
+            "frame": profiler.frame - 1,
+            "ms": round(profiler.last_ms, 3),
+            "budget_ms": round(self.budget_ms, 3),
+            "phases": {name: round(ns / 1e6, 3) for name, ns in zip(PROFILE_PHASES, profiler.phase_ns)},
+            "gc_ms": round(self.gc_ns / 1e6, 3),
+            "gc_runs": list(self.gc_runs),
+            "gc_counts": list(gc.get_count()),
+            "gc_enabled": gc.isenabled(),
+            "gc_scheduled": self.gc_control.collections,
+            "alloc_blocks": blocks,
+        }
+        if self.tracing:
+            import tracemalloc
+
+            snapshot = tracemalloc.take_snapshot()
+            top = snapshot.compare_to(self.baseline, "lineno")[:HITCH_TOP_SITES]
+            self.baseline = snapshot
+            record["alloc_sites"] = [
+                f"{stat.traceback[0]}: {stat.size_diff:+d} B in {stat.count_diff:+d} blocks" for stat in top
+            ]
+        record.update(zip(PROFILE_COUNTS, (len(game.player_bullets), len(game.enemy_bullets), len(game.heal_pickups))))
+        self.stream.write(json.dumps(record) + "\n")
+        self.stream.flush()
+
+    def close(self):
+        gc.callbacks.remove(self._on_gc)
+        if self.trace:
+            import tracemalloc
+
+            tracemalloc.stop()
+        if self.stream is not sys.stderr:
+            self.stream.close()
+
+
+TELEMETRY_VERSION = 1
+TELEMETRY_CHUNK = 1 << 16
+TELEMETRY_COLUMNS = (
+    ("t", np.float64),
+    ("frame_ms", np.float32),
+    ("level", np.int32),
+    ("t_level", np.float32),
+    ("player_x", np.float32),
+    ("player_y", np.float32),
+    ("hp", np.int32),
+    ("max_hp", np.int32),
+    ("boss_hp", np.int64),
+    ("player_bullets", np.int32),
+    ("enemy_bullets", np.int32),
+    ("heal_pickups", np.int32),
+    ("patterns", np.uint8),
+)
+
+
+def telemetry_file(path, name):
+    return os.path.join(path, name + ".col")
+
+
+class TelemetryWriter:
+    def __init__(self, path, chunk=TELEMETRY_CHUNK):
+        os.makedirs(path, exist_ok=True)
+        meta = {
+            "version": TELEMETRY_VERSION,
+            "columns": [[name, np.dtype(dtype).str] for name, dtype in TELEMETRY_COLUMNS],
+            "patterns": [spec.name for spec in PATTERN_POOL],
+        }
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+        self.path = path
+        self.chunk = chunk
+        self.rows = 0
+        self.capacity = 0
+        self.columns = {}
+        self.maps = []
+        # The row count lives in its own mapped word, so a reader (or a crash)
+        # always sees how many rows are complete.
+        self.count = np.memmap(os.path.join(path, "rows"), dtype=np.int64, mode="w+", shape=(1,))
+        for name, _ in TELEMETRY_COLUMNS:
+            open(telemetry_file(path, name), "wb").close()
+        self.start = time.perf_counter()
+        self.patterns_of = None
+        self.pattern_mask = 0
+        self._grow()
+
+    def _grow(self):
+        # Columns grow a chunk at a time: extend each file and map it again.
+        self.capacity += self.chunk
+        for m in self.maps:
+            m.flush()
+        self.maps = []
+        for name, dtype in TELEMETRY_COLUMNS:
+            m = np.memmap(telemetry_file(self.path, name), dtype=dtype, mode="r+", shape=(self.capacity,))
+            self.maps.append(m)
+            self.columns[name] = m.view(np.ndarray)
+
+    def append(self, frame_ms, game):
+        i = self.rows
+        if i == self.capacity:
+            self._grow()
+        if game.patterns is not self.patterns_of:
+            self.patterns_of = game.patterns
+            self.pattern_mask = sum(1 << PATTERN_POOL.index(spec) for spec in game.patterns)
+        player = game.player
+        c = self.columns
+        c["t"][i] = time.perf_counter() - self.start
+        c["frame_ms"][i] = frame_ms
+        c["level"][i] = game.level
+        c["t_level"][i] = game.t_global
+        c["player_x"][i] = player.x
+        c["player_y"][i] = player.y
+        c["hp"][i] = player.hp
+        c["max_hp"][i] = player.max_hp
+        c["boss_hp"][i] = game.boss_hp
+        c["player_bullets"][i] = len(game.player_bullets)
+        c["enemy_bullets"][i] = len(game.enemy_bullets)
+        c["heal_pickups"][i] = len(game.heal_pickups)
+        c["patterns"][i] = self.pattern_mask
+        self.rows = i + 1
+        self.count[0] = self.rows
+
+    def close(self):
+        for m in self.maps:
+            m.flush()
+        self.maps = []
+        self.columns = {}
+        self.count.flush()
+        for name, dtype in TELEMETRY_COLUMNS:
+            with open(telemetry_file(self.path, name), "r+b") as f:
+                f.truncate(self.rows * np.dtype(dtype).itemsize)
+
+
+class TelemetryLog:
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("version") != TELEMETRY_VERSION:
+            raise ValueError(f"{path}: unsupported telemetry version {meta.get('version')}")
+        self.rows = int(np.fromfile(os.path.join(path, "rows"), dtype=np.int64, count=1)[0])
+        self.pattern_names = meta["patterns"]
+        # Each column is a read-only view straight onto its file; nothing is
+        # read until it is touched.
+        self.columns = {}
+        for name, dtype in meta["columns"]:
+            if self.rows:
+                column = np.memmap(telemetry_file(path, name), dtype=np.dtype(dtype), mode="r", shape=(self.rows,))
+            else:
+                column = np.zeros(0, dtype=np.dtype(dtype))
+            self.columns[name] = column
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def pattern_active(self, name):
+        return (self.columns["patterns"] & (1 << self.pattern_names.index(name))) != 0
+
+
+def new_seed():
+    return random.getrandbits(32)
+
+
+class GameState:
+    def __init__(self, difficulty=DEFAULT_DIFFICULTY, seed=None, motion="integrate", sim_hz=SIM_HZ, continuous=True):
+        self.seed = new_seed() if seed is None else seed
+        self.rng = random.Random(self.seed)
+        self.motion = motion
+        self.sim_hz = sim_hz
+        self.dt = 1.0 / sim_hz
+        self.continuous = continuous
+        self.player = Player()
+        self.enemy = Enemy()
+        self.player_bullets = BulletField(motion=motion)
+        self.enemy_bullets = BulletField(motion=motion)
+        self.heal_pickups = EntityPool(HealPickup)
+        self.player_grid = SpatialHash()
+        self.enemy_grid = SpatialHash()
+        self.boss_hp_growth = BOSS_HP_GROWTH
+        self.set_difficulty(difficulty)
+        self.level = 1
+        self._start_level()
+
+    def set_difficulty(self, difficulty):
+        self.difficulty = difficulty
+        self.base_boss_hp = DIFFICULTIES[difficulty]["boss_hp"]
+        self.heal_interval = DIFFICULTIES[difficulty]["heal_interval"]
+
+    def clear_entities(self):
+        self.player_bullets.clear()
+        self.enemy_bullets.clear()
+        self.heal_pickups.clear()
+
+    def reset_run(self, seed=None):
+        self.seed = new_seed() if seed is None else seed
+        self.rng.seed(self.seed)
+        self.player.reset_for_new_run()
+        self.level = 1
+        self._start_level()
+
+    def start_next_level(self):
+        self.player.reset_position()
+        self.level += 1
+        self._start_level()
+
+    def jump_to_level(self, level, patterns=None):
+        self.player.reset_position()
+        self.level = level
+        self._start_level()
+        if patterns is not None:
+            self.patterns = list(patterns)
+            self.schedule = PatternSchedule(self.patterns, self.level)
+
+    def _start_level(self):
+        self.enemy.reset()
+        self.clear_entities()
+        self.mode = "playing"
+        self.upgrade_choices = []
+        self.t_global = 0.0
+        self.boss_max_hp = boss_hp_for_level(self.base_boss_hp, self.level, self.boss_hp_growth)
+        self.boss_hp = self.boss_max_hp
+        self.level_damage = 0
+        self.heal_spawn_timer = self.heal_interval
+        self.patterns = choose_patterns(self.level, self.rng)
+        self.schedule = PatternSchedule(self.patterns, self.level)
+
+
+def step(game, inputs, dt):
+    if game.mode == "upgrade":
+        idx = inputs.upgrade_pick
+        if not 0 <= idx < len(game.upgrade_choices):
+            return
+        apply_upgrade(game.player, game.upgrade_choices[idx][0])
+        game.start_next_level()
+
+    if game.mode != "playing":
+        return
+
+    player = game.player
+    enemy = game.enemy
+
+    if inputs.super_pressed and game.boss_hp > 0 and player.can_super():
+        spawn_super_bullet(player, game.player_bullets)
+        player.use_super()
+
+    game.t_global += dt
+    player.update(dt, inputs)
+    enemy.update(dt)
+
+    game.heal_spawn_timer -= dt
+    if game.heal_spawn_timer <= 0.0:
+        spawn_heal_pickup(game.heal_pickups, game.rng)
+        if game.continuous:
+            game.heal_spawn_timer += game.heal_interval
+        else:
+            game.heal_spawn_timer = game.heal_interval
+
+    if inputs.shoot and player.can_shoot():
+        late = player.shoot(game.continuous)
+        if game.continuous:
+            spawn_player_bullets(player, game.player_bullets, late - dt, clamp(1.0 - late / dt, 0.0, 1.0))
+        else:
+            spawn_player_bullets(player, game.player_bullets)
+
+    if game.boss_hp > 0:
+        t0 = time.perf_counter_ns()
+        spawn_enemy_patterns(
+            enemy,
+            player,
+            game.enemy_bullets,
+            game.t_global,
+            game.schedule,
+            game.rng,
+            dt if game.continuous else None,
+        )
+        PROFILER.add(PHASE_PATTERNS, time.perf_counter_ns() - t0)
 
-            draw_button(screen, font, opt_back_rect, "BACK")
+    game.player_bullets.update(dt)
+    game.enemy_bullets.update(dt)
 
-            player_label = font.render("Player Color", True, (235, 235, 235))
-            screen.blit(player_label, (WIDTH // 2 - 200, int(HEIGHT * 0.36) + 12))
-            draw_button(screen, font, p_left, "<")
-            pygame.draw.rect(screen, player_color, p_swatch, border_radius=8)
-            pygame.draw.rect(screen, (140, 140, 160), p_swatch, width=2, border_radius=8)
-            draw_button(screen, font, p_right, ">")
+    t0 = time.perf_counter_ns()
+    game.player_bullets.index(game.player_grid)
+    if game.continuous:
+        dmg = game.player_bullets.collide_swept(
+            enemy.prev_x, enemy.prev_y, enemy.x, enemy.y, ENEMY_RADIUS, dt, game.player_grid, game.boss_hp
+        )
+    else:
+        dmg = game.player_bullets.collide_circle(enemy.x, enemy.y, ENEMY_RADIUS, game.player_grid)
+    game.boss_hp = max(0, game.boss_hp - dmg)
 
-            enemy_label = font.render("Enemy Color", True, (235, 235, 235))
-            screen.blit(enemy_label, (WIDTH // 2 - 200, int(HEIGHT * 0.48) + 12))
-            draw_button(screen, font, e_left, "<")
-            pygame.draw.rect(screen, enemy_color, e_swatch, border_radius=8)
-            pygame.draw.rect(screen, (140, 140, 160), e_swatch, width=2, border_radius=8)
-            draw_button(screen, font, e_right, ">")
+    game.enemy_bullets.index(game.enemy_grid)
+    if game.continuous:
+        dmg = game.enemy_bullets.collide_swept(
+            player.prev_x, player.prev_y, player.x, player.y, PLAYER_RADIUS, dt, game.enemy_grid, player.hp
+        )
+    else:
+        dmg = game.enemy_bullets.collide_circle(player.x, player.y, PLAYER_RADIUS, game.enemy_grid)
+    player.hp = max(0, player.hp - dmg)
+    game.level_damage += dmg
+    PROFILER.add(PHASE_COLLISION, time.perf_counter_ns() - t0)
+
+    for p in game.heal_pickups:
+        p.update(dt)
+        if not p.dead:
+            if game.continuous:
+                touched = pickup_touched(p, player)
+            else:
+                touched = dist2(p.x, p.y, player.x, player.y) <= (p.radius + PLAYER_RADIUS) ** 2
+            if touched:
+                p.dead = True
+                player.hp = min(player.max_hp, player.hp + HEAL_AMOUNT)
+
+    game.player_bullets.compact()
+    game.enemy_bullets.compact()
+    game.heal_pickups.compact()
+
+    if game.boss_hp <= 0:
+        game.mode = "upgrade"
+        game.upgrade_choices = roll_upgrades(game.rng)
+        game.enemy_bullets.clear()
+        game.heal_pickups.clear()
+
+    if player.hp <= 0:
+        game.mode = "game_over"
+
+
+def pickup_touched(p, player):
+    r = p.radius + PLAYER_RADIUS
+    dx0 = p.x - player.prev_x
+    dy0 = p.prev_y - player.prev_y
+    dx1 = p.x - player.x
+    dy1 = p.y - player.y
+    ex = dx1 - dx0
+    ey = dy1 - dy0
+    a = ex * ex + ey * ey
+    b = dx0 * ex + dy0 * ey
+    c = dx0 * dx0 + dy0 * dy0 - r * r
+    if c <= 0.0 or dx1 * dx1 + dy1 * dy1 <= r * r:
+        return True
+    # Closest approach inside the step and within reach.
+    return a > 0.0 and -a < b < 0.0 and b * b >= a * c
+
+
+def state_digest(game):
+    h = hashlib.sha1()
+    p = game.player
+    # Boss HP outgrows int32 by level 56 on hard; a digest only needs its bits.
+    boss_hp = game.boss_hp & 0xFFFFFFFFFFFFFFFF
+    h.update(struct.pack("<4d3iQ", p.x, p.y, game.enemy.x, game.t_global, p.hp, p.max_hp, game.level, boss_hp))
+    for bullets in (game.player_bullets, game.enemy_bullets):
+        bullets.sync()
+        live = bullets.live()
+        h.update(bullets.x[live].tobytes())
+        h.update(bullets.y[live].tobytes())
+    for pickup in game.heal_pickups:
+        h.update(struct.pack("<2d", pickup.x, pickup.y))
+    return h.hexdigest()[:16]
+
+
+SNAPSHOT_INTERVAL = 30
+SNAPSHOT_BUDGET = 32 * 1024 * 1024
+REWIND_SECONDS = 1.0
+RETRY_SECONDS = 3.0
+
+GAME_STATE = (
+    "level",
+    "boss_hp",
+    "boss_max_hp",
+    "level_damage",
+    "t_global",
+    "heal_spawn_timer",
+    "heal_interval",
+    "base_boss_hp",
+    "boss_hp_growth",
+)
+PLAYER_STATE = (
+    "x",
+    "y",
+    "prev_x",
+    "prev_y",
+    "move_speed",
+    "bullet_damage",
+    "super_damage",
+    "super_cooldown",
+    "max_hp",
+    "hp",
+    "shot_cd",
+    "super_cd",
+)
+ENEMY_STATE = ("x", "y", "prev_x", "prev_y", "t", "base_x")
+FIELD_STATE = ("count", "dead", "t", "tick", "last_dt", "synced", "epoch", "max_speed", "next_serial")
+GRID_STATE = ("indexed", "max_radius", "slack", "epoch", "tick", "t")
+PICKUP_DTYPE = np.dtype([("x", np.float64), ("y", np.float64), ("prev_y", np.float64)])
+POSITION_COLUMNS = ("x", "y", "px", "py")
+
+
+def pack_attrs(obj, names, out):
+    for name in names:
+        out.append(getattr(obj, name))
+
+
+def unpack_attrs(obj, names, values, i):
+    # Scalars travel as float64; cast back to the attribute's own type so ints
+    # stay ints.
+    for name in names:
+        setattr(obj, name, type(getattr(obj, name))(values[i]))
+        i += 1
+    return i
+
+
+def snapshot_columns(field):
+    # Analytic positions are a function of time, so sync() rebuilds them from
+    # the spawn columns instead of every capture copying them.
+    if field.analytic:
+        return [name for name, _ in field.fields if name not in POSITION_COLUMNS]
+    return [name for name, _ in field.fields]
+
+
+def encode_state(game):
+    # A capture is a list of plain array copies: float64 scalars, RNG words,
+    # each bullet field's columns, pickups, then the analytic grids.
+    fields = (game.enemy_bullets, game.player_bullets)
+    grids = (game.enemy_grid, game.player_grid) if game.motion == "analytic" else ()
+    _, words, gauss = game.rng.getstate()
+    scalars = []
+    pack_attrs(game, GAME_STATE, scalars)
+    pack_attrs(game.player, PLAYER_STATE, scalars)
+    pack_attrs(game.enemy, ENEMY_STATE, scalars)
+    scalars.append(math.nan if gauss is None else gauss)
+    patterns = [PATTERN_POOL.index(spec) for spec in game.patterns]
+    scalars.extend(patterns + [-1] * (len(PATTERN_POOL) - len(patterns)))
+    for field in fields:
+        pack_attrs(field, FIELD_STATE, scalars)
+    for grid in grids:
+        pack_attrs(grid, GRID_STATE, scalars)
+
+    parts = [np.array(scalars, dtype=np.float64), np.array(words, dtype=np.uint32)]
+    for field in fields:
+        n = field.count
+        parts.extend(getattr(field, name)[:n].copy() for name in snapshot_columns(field))
+    pickups = np.empty(len(game.heal_pickups), dtype=PICKUP_DTYPE)
+    for i, p in enumerate(game.heal_pickups):
+        pickups[i] = (p.x, p.y, p.prev_y)
+    parts.append(pickups)
+    for grid in grids:
+        parts.append(grid.cell_start.copy())
+        parts.append(grid.order.copy())
+    return parts
+
+
+def decode_state(game, parts):
+    fields = (game.enemy_bullets, game.player_bullets)
+    grids = (game.enemy_grid, game.player_grid) if game.motion == "analytic" else ()
+    parts = iter(parts)
+    values = next(parts).tolist()
+    words = next(parts)
+
+    i = unpack_attrs(game, GAME_STATE, values, 0)
+    i = unpack_attrs(game.player, PLAYER_STATE, values, i)
+    i = unpack_attrs(game.enemy, ENEMY_STATE, values, i)
+    gauss = values[i]
+    game.rng.setstate((game.rng.VERSION, tuple(words.tolist()), None if math.isnan(gauss) else gauss))
+    i += 1
+    game.patterns = [PATTERN_POOL[int(k)] for k in values[i : i + len(PATTERN_POOL)] if k >= 0]
+    i += len(PATTERN_POOL)
+    game.mode = "playing"
+    game.upgrade_choices = []
+    game.schedule = PatternSchedule(game.patterns, game.level)
+    game.schedule.seek(game.t_global)
+
+    for field in fields:
+        old = field.count
+        i = unpack_attrs(field, FIELD_STATE, values, i)
+        n = field.count
+        if n > field.capacity:
+            field.count = old
+            field._grow(n)
+            field.count = n
+        for name in snapshot_columns(field):
+            getattr(field, name)[:n] = next(parts)
+        if field.analytic:
+            field.synced = -1
+            serials = field.serial[:n]
+            field.row_of = dict(zip(serials.tolist(), range(n)))
+            # Entries already popped had exit times before t; rebuild the rest.
+            t_exit = field.t0[:n] + exit_times(field.ox[:n], field.oy[:n], field.vx[:n], field.vy[:n])
+            pending = t_exit >= field.t
+            field.expiry = list(zip(t_exit[pending].tolist(), serials[pending].tolist()))
+            heapq.heapify(field.expiry)
+
+    game.heal_pickups.clear()
+    for x, y, prev_y in next(parts).tolist():
+        p = game.heal_pickups.acquire()
+        p.reset(x)
+        p.y = y
+        p.prev_y = prev_y
+
+    for grid in grids:
+        i = unpack_attrs(grid, GRID_STATE, values, i)
+        grid.cell_start[:] = next(parts)
+        grid.order = next(parts).copy()
+
+
+class Snapshot:
+    __slots__ = ("tick", "parts", "nbytes", "tag")
+
+    def __init__(self, tick, parts, tag):
+        self.tick = tick
+        self.parts = parts
+        self.nbytes = sum(part.nbytes for part in parts)
+        self.tag = tag
+
+
+class SnapshotRing:
+    def __init__(self, interval=SNAPSHOT_INTERVAL, budget=SNAPSHOT_BUDGET):
+        self.interval = interval
+        self.budget = budget
+        self.entries = deque()
+        self.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.tick = 0
+        self.size = 0
+
+    def advance(self):
+        self.tick += 1
+        return self.tick % self.interval == 0
+
+    def capture(self, game, tag=None):
+        # Captures are stored uncompressed: copying the columns costs about as
+        # much as one memcpy of the live rows, where compressing them did not
+        # fit in a frame once the field was large.
+        entry = Snapshot(self.tick, encode_state(game), tag)
+        self.entries.append(entry)
+        self.size += entry.nbytes
+        entries = self.entries
+        while len(entries) > 1 and self.size > self.budget:
+            self.size -= entries.popleft().nbytes
+
+    def restore(self, game, entry):
+        decode_state(game, entry.parts)
+
+    def rewind(self, game, ticks):
+        if not self.entries:
+            return None
+        entries = self.entries
+        while len(entries) > 1 and entries[-1].tick > self.tick - ticks:
+            self.size -= entries.pop().nbytes
+        entry = entries[-1]
+        self.restore(game, entry)
+        self.tick = entry.tick
+        return entry
+
+
+REPLAY_MAGIC = b"BHRP"
+REPLAY_VERSION = 3
+REPLAY_HEADER = struct.Struct("<4sBBBIHI")
+REPLAY_HEADER_V1 = struct.Struct("<4sBBIHI")
+INPUT_BITS = ("left", "right", "up", "down", "slow", "shoot", "super_pressed")
+PICK_FLAG = 0x80
+
+
+class InputRecorder:
+    def __init__(self, seed, difficulty, motion="integrate", sim_hz=SIM_HZ):
+        self.seed = seed
+        self.difficulty = difficulty
+        self.motion = motion
+        self.sim_hz = sim_hz
+        self.data = bytearray()
+        self.ticks = 0
+
+    def record(self, inputs):
+        bits = 0
+        for i, name in enumerate(INPUT_BITS):
+            if getattr(inputs, name):
+                bits |= 1 << i
+        if inputs.upgrade_pick >= 0:
+            self.data.append(bits | PICK_FLAG)
+            self.data.append(inputs.upgrade_pick)
+        else:
+            self.data.append(bits)
+        self.ticks += 1
+
+    def mark(self):
+        return self.ticks, len(self.data)
+
+    def truncate(self, mark):
+        self.ticks, size = mark
+        del self.data[size:]
+
+    def save(self, path):
+        header = REPLAY_HEADER.pack(
+            REPLAY_MAGIC,
+            REPLAY_VERSION,
+            DIFFICULTY_ORDER.index(self.difficulty),
+            MOTION_MODES.index(self.motion),
+            self.seed,
+            self.sim_hz,
+            self.ticks,
+        )
+        with open(path, "wb") as f:
+            f.write(header)
+            f.write(zlib.compress(bytes(self.data), 9))
+
+
+class InputReplay:
+    def __init__(self, seed, difficulty, data, ticks, motion="integrate", sim_hz=SIM_HZ, continuous=True):
+        self.seed = seed
+        self.difficulty = difficulty
+        self.motion = motion
+        self.sim_hz = sim_hz
+        self.continuous = continuous
+        self.data = data
+        self.ticks = ticks
+        self.pos = 0
+        self.tick = 0
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            raw = f.read()
+        magic, version = struct.unpack_from("<4sB", raw)
+        if magic != REPLAY_MAGIC or not 1 <= version <= REPLAY_VERSION:
+            raise ValueError(f"{path}: not a replay file")
+        if version == 1:
+            header = REPLAY_HEADER_V1
+            _, _, diff_idx, seed, sim_hz, ticks = header.unpack_from(raw)
+            motion_idx = 0
+        else:
+            header = REPLAY_HEADER
+            _, _, diff_idx, motion_idx, seed, sim_hz, ticks = header.unpack_from(raw)
+        data = zlib.decompress(raw[header.size :])
+        # Versions before 3 were recorded with point-in-time collision.
+        return cls(seed, DIFFICULTY_ORDER[diff_idx], data, ticks, MOTION_MODES[motion_idx], sim_hz, version >= 3)
+
+    @property
+    def done(self):
+        return self.tick >= self.ticks
+
+    def read(self, inputs):
+        if self.done:
+            return False
+        bits = self.data[self.pos]
+        self.pos += 1
+        for i, name in enumerate(INPUT_BITS):
+            setattr(inputs, name, bool(bits & (1 << i)))
+        if bits & PICK_FLAG:
+            inputs.upgrade_pick = self.data[self.pos]
+            self.pos += 1
+        else:
+            inputs.upgrade_pick = -1
+        self.tick += 1
+        return True
+
+
+def simulate_replay(replay):
+    game = GameState(replay.difficulty, motion=replay.motion, sim_hz=replay.sim_hz, continuous=replay.continuous)
+    game.reset_run(replay.seed)
+    inputs = InputFrame()
+    while replay.read(inputs):
+        step(game, inputs, game.dt)
+    return game
+
+
+BOT_DANGER_RADIUS = 90.0
+BOT_HOME_Y = HEIGHT * 0.82
+BOT_DEADZONE = 0.15
+
+
+class DodgeBot:
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+
+    def pick_upgrade(self, game):
+        return self.rng.randrange(len(game.upgrade_choices))
+
+    def read(self, game, inputs):
+        if game.mode == "upgrade":
+            inputs.upgrade_pick = self.pick_upgrade(game)
+            return
+        player = game.player
+        bullets = game.enemy_bullets
+        bullets.sync()
+        live = bullets.live()
+        dx = bullets.x[live] - player.x
+        dy = bullets.y[live] - player.y
+        d2 = dx * dx + dy * dy
+        near = d2 < BOT_DANGER_RADIUS * BOT_DANGER_RADIUS
+        if near.any():
+            w = 1.0 / np.maximum(d2[near], 1.0)
+            fx = -float((dx[near] * w).sum()) * BOT_DANGER_RADIUS
+            fy = -float((dy[near] * w).sum()) * BOT_DANGER_RADIUS
+        else:
+            fx = fy = 0.0
+        fx += (game.enemy.x - player.x) / WIDTH
+        fy += (BOT_HOME_Y - player.y) / HEIGHT
+
+        inputs.left = fx < -BOT_DEADZONE
+        inputs.right = fx > BOT_DEADZONE
+        inputs.up = fy < -BOT_DEADZONE
+        inputs.down = fy > BOT_DEADZONE
+        inputs.slow = False
+        inputs.shoot = True
+        inputs.super_pressed = player.can_super()
+
+
+BOT_HORIZON = 0.35
+BOT_MARGIN = 6.0
+BOT_GOAL_WEIGHT = 0.6
+BOT_SLOW_COST = 0.02
+BOT_KEEP_BONUS = 0.01
+BOT_MOVES = [
+    (left, right, up, down, slow)
+    for slow in (False, True)
+    for left, right in ((False, False), (True, False), (False, True))
+    for up, down in ((False, False), (True, False), (False, True))
+]
+BOT_MOVES.remove((False, False, False, False, True))
+BOT_MOVE_DIR = np.array([[r - l, d - u] for l, r, u, d, _ in BOT_MOVES], dtype=np.float64)
+BOT_MOVE_DIR /= np.maximum(np.hypot(BOT_MOVE_DIR[:, 0], BOT_MOVE_DIR[:, 1]), 1.0)[:, None]
+BOT_MOVE_MULT = np.array([PLAYER_SLOW_MULT if m[4] else 1.0 for m in BOT_MOVES])
+BOT_MOVE_COST = np.array([BOT_SLOW_COST if m[4] else 0.0 for m in BOT_MOVES])
 
-            diff_label = font.render("Difficulty", True, (235, 235, 235))
-            screen.blit(diff_label, (WIDTH // 2 - 200, int(HEIGHT * 0.62) + 14))
 
-            draw_button(screen, font, diff_easy, "EASY", enabled=True)
-            draw_button(screen, font, diff_normal, "NORMAL", enabled=True)
-            draw_button(screen, font, diff_hard, "HARD", enabled=True)
+class LookaheadBot(DodgeBot):
+    def __init__(self, seed):
+        super().__init__(seed)
+        self.last_move = 0
+        self.last_decision_ns = 0
 
-            sel_rect = {"easy": diff_easy, "normal": diff_normal, "hard": diff_hard}[difficulty]
-            pygame.draw.rect(screen, (90, 220, 120), sel_rect, width=4, border_radius=10)
+    def choose_move(self, game):
+        player = game.player
+        pad = PLAYER_RADIUS + 6
+        speed = player.move_speed * BOT_MOVE_MULT
+        end_x = np.clip(player.x + BOT_MOVE_DIR[:, 0] * speed * BOT_HORIZON, pad, WIDTH - pad)
+        end_y = np.clip(player.y + BOT_MOVE_DIR[:, 1] * speed * BOT_HORIZON, pad, HEIGHT - pad)
+
+        tx, ty = game.enemy.x, BOT_HOME_Y
+        if player.hp < player.max_hp and len(game.heal_pickups):
+            p = min(game.heal_pickups, key=lambda p: dist2(p.x, p.y, player.x, player.y))
+            tx, ty = p.x, p.y + HEAL_FALL_SPEED * BOT_HORIZON
+        cost = BOT_MOVE_COST + BOT_GOAL_WEIGHT * (np.abs(end_x - tx) / WIDTH + np.abs(end_y - ty) / HEIGHT)
+        cost[self.last_move] -= BOT_KEEP_BONUS
+
+        bullets = game.enemy_bullets
+        bullets.sync()
+        if len(bullets):
+            live = bullets.live()
+            rx = bullets.x[live] - player.x
+            ry = bullets.y[live] - player.y
+            vx = bullets.vx[live]
+            vy = bullets.vy[live]
+            hit_r = bullets.radii(live) + PLAYER_RADIUS
+            # Keep only bullets whose path passes within the player's reachable
+            # disc during the horizon; everything else scores zero for all moves.
+            t = np.clip(-(rx * vx + ry * vy) / (vx * vx + vy * vy + 1e-9), 0.0, BOT_HORIZON)
+            reach = player.move_speed * BOT_HORIZON + hit_r + BOT_MARGIN
+            near = dist2(rx + vx * t, ry + vy * t, 0.0, 0.0) < reach * reach
+            if near.any():
+                rx = rx[near].astype(np.float32)
+                ry = ry[near].astype(np.float32)
+                hit_r = hit_r[near].astype(np.float32)
+                # Relative motion is linear over the horizon, so each candidate's
+                # closest approach to each bullet has a closed form. The (moves x
+                # bullets) pass runs in place in float32 to stay well under 1 ms.
+                wx = vx[near].astype(np.float32) - ((end_x - player.x) / BOT_HORIZON).astype(np.float32)[:, None]
+                wy = vy[near].astype(np.float32) - ((end_y - player.y) / BOT_HORIZON).astype(np.float32)[:, None]
+                t = rx * wx
+                t += ry * wy
+                w2 = wx * wx
+                w2 += wy * wy
+                w2 += 1e-9
+                t /= w2
+                np.clip(-t, 0.0, BOT_HORIZON, out=t)
+                wx *= t
+                wx += rx
+                wy *= t
+                wy += ry
+                wx *= wx
+                wy *= wy
+                wx += wy
+                gap = np.sqrt(wx, out=wx)
+                gap -= hit_r
+                gap *= -1.0 / BOT_MARGIN
+                gap += 1.0
+                pen = np.maximum(gap, 0.0, out=gap)
+                pen *= pen
+                t += 0.05
+                pen /= t
+                cost += pen.sum(axis=1)
+
+        self.last_move = int(np.argmin(cost))
+        return BOT_MOVES[self.last_move]
+
+    def read(self, game, inputs):
+        if game.mode == "upgrade":
+            inputs.upgrade_pick = self.pick_upgrade(game)
+            return
+        t0 = time.perf_counter_ns()
+        inputs.left, inputs.right, inputs.up, inputs.down, inputs.slow = self.choose_move(game)
+        self.last_decision_ns = time.perf_counter_ns() - t0
+        inputs.shoot = True
+        inputs.super_pressed = game.player.can_super()
+
+
+BOTS = {"dodge": DodgeBot, "lookahead": LookaheadBot}
+
+
+def draw_ship(surface, color, x, y):
+    pygame.draw.polygon(
+        surface,
+        color,
+        [(x, y - 14), (x - 10, y + 12), (x + 10, y + 12)],
+    )
+    pygame.draw.circle(surface, (40, 40, 40), (x, y), 3)
 
-            hint = font.render(
-                f"Boss HP: {DIFFICULTIES[difficulty]['boss_hp']}   Heal every ~{DIFFICULTIES[difficulty]['heal_interval']:.0f}s",
-                True,
-                (200, 200, 210),
-            )
-            screen.blit(hint, (WIDTH // 2 - 200, int(HEIGHT * 0.72)))
 
-            pygame.display.flip()
-            continue
+SPRITE_KEY = (255, 0, 255)
+RASTER_THRESHOLD = 3500
 
-        pygame.draw.circle(screen, enemy_color, (int(enemy.x), int(enemy.y)), ENEMY_RADIUS)
 
-        for b in player_bullets:
-            if b.damage >= SUPER_DAMAGE:
-                pygame.draw.circle(screen, (60, 150, 255), (int(b.x), int(b.y)), b.radius)
+class SpriteCache:
+    def __init__(self):
+        self.sprites = {}
+
+    def _get(self, key, size, origin, paint, keyed=True):
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            # Sprites are fully opaque shapes, so an RLE colour key blits exactly
+            # like the draw calls but far cheaper than per-pixel alpha.
+            surf = pygame.Surface(size).convert()
+            surf.fill(SPRITE_KEY)
+            paint(surf, *origin)
+            if keyed:
+                surf.set_colorkey(SPRITE_KEY, pygame.RLEACCEL)
+            sprite = (surf, origin)
+            self.sprites[key] = sprite
+        return sprite
+
+    def circle(self, radius, color):
+        size = (2 * radius + 1, 2 * radius + 1)
+
+        def paint(surf, x, y):
+            pygame.draw.circle(surf, color, (x, y), radius)
+
+        return self._get(("circle", radius, color), size, (radius, radius), paint)
+
+    def square(self, radius, color):
+        size = (2 * radius + 1, 2 * radius + 1)
+
+        def paint(surf, x, y):
+            surf.fill(color)
+
+        return self._get(("square", radius, color), size, (radius, radius), paint, keyed=False)
+
+    def bullet(self, kind, cheap=False):
+        k = BULLET_KINDS[kind]
+        if cheap:
+            return self.square(k.radius, k.color)
+        return self.circle(k.radius, k.color)
+
+    def stamp(self, kind, cheap, target):
+        key = ("stamp", kind, cheap, target.get_pitch(), target.get_bitsize())
+        stamp = self.sprites.get(key)
+        if stamp is None:
+            surf, (ox, oy) = self.bullet(kind, cheap)
+            pixels = pygame.surfarray.array2d(surf)
+            if surf.get_colorkey() is None:
+                mask = np.ones(pixels.shape, dtype=bool)
             else:
-                pygame.draw.circle(screen, (110, 200, 255), (int(b.x), int(b.y)), b.radius)
-
-        for b in enemy_bullets:
-            pygame.draw.circle(screen, (255, 200, 90), (int(b.x), int(b.y)), b.radius)
+                mask = pixels != surf.map_rgb(surf.get_colorkey())
+            mx, my = np.nonzero(mask)
+            pitch = target.get_pitch() // target.get_bytesize()
+            values = np.array([target.map_rgb(surf.unmap_rgb(v)) for v in pixels[mx, my].tolist()], dtype=np.uint32)
+            stamp = ((my - oy) * pitch + (mx - ox), values, surf.get_size(), (ox, oy), pitch)
+            self.sprites[key] = stamp
+        return stamp
+
+    def heal_pickup(self):
+        return self._get(("heal",), (14, 14), (7, 7), draw_heal_pickup)
+
+    def ship(self, color):
+        def paint(surf, x, y):
+            draw_ship(surf, color, x, y)
+
+        return self._get(("ship", color), (21, 27), (10, 14), paint)
+
+
+def sprite_dests(xs, ys, ox, oy):
+    return np.column_stack((xs.astype(int) - ox, ys.astype(int) - oy)).tolist()
+
+
+def raster_bullets(screen, stamp, xs, ys):
+    offsets, values, (w, h), (ox, oy), pitch = stamp
+    width, height = screen.get_size()
+    inside = (xs >= ox) & (xs - ox + w <= width) & (ys >= oy) & (ys - oy + h <= height)
+    # Bullets whose sprite box lies wholly on screen are stamped straight into the
+    # pixel buffer; same truncated positions and mask as the blits, so same pixels.
+    base = ys[inside] * pitch + xs[inside]
+    pixels = np.frombuffer(screen.get_view("1"), dtype=np.uint32)
+    pixels[np.add.outer(base, offsets)] = values
+    del pixels
+    return ~inside
+
+
+def draw_world(screen, sprites, game, player_color, enemy_color, alpha=1.0, cheap=False):
+    enemy = game.enemy
+    player = game.player
+    surf, (ox, oy) = sprites.circle(ENEMY_RADIUS, enemy_color)
+    ex = int(lerp(enemy.prev_x, enemy.x, alpha))
+    ey = int(lerp(enemy.prev_y, enemy.y, alpha))
+    screen.blit(surf, (ex - ox, ey - oy))
+
+    bullets = game.player_bullets
+    bullets.sync()
+    if len(bullets):
+        live = bullets.live()
+        kinds = bullets.kind[live]
+        offsets = bullets.radii(live).astype(int)
+        dests = sprite_dests(
+            lerp(bullets.px[live], bullets.x[live], alpha),
+            lerp(bullets.py[live], bullets.y[live], alpha),
+            offsets,
+            offsets,
+        )
+        kind_surfs = [sprites.bullet(kind, cheap)[0] for kind in range(len(BULLET_KINDS))]
+        screen.blits(zip([kind_surfs[k] for k in kinds.tolist()], dests), doreturn=False)
+
+    bullets = game.enemy_bullets
+    bullets.sync()
+    if len(bullets):
+        live = bullets.live()
+        surf, (ox, oy) = sprites.bullet(KIND_ENEMY, cheap)
+        xs = lerp(bullets.px[live], bullets.x[live], alpha)
+        ys = lerp(bullets.py[live], bullets.y[live], alpha)
+        if len(xs) >= RASTER_THRESHOLD and screen.get_bytesize() == 4 and screen.get_clip() == screen.get_rect():
+            xs = xs.astype(int)
+            ys = ys.astype(int)
+            edge = raster_bullets(screen, sprites.stamp(KIND_ENEMY, cheap, screen), xs, ys)
+            xs = xs[edge]
+            ys = ys[edge]
+        dests = sprite_dests(xs, ys, ox, oy)
+        screen.blits(zip(itertools.repeat(surf), dests), doreturn=False)
+
+    if len(game.heal_pickups):
+        surf, (ox, oy) = sprites.heal_pickup()
+        screen.blits(
+            [(surf, (int(p.x) - ox, int(lerp(p.prev_y, p.y, alpha)) - oy)) for p in game.heal_pickups],
+            doreturn=False,
+        )
 
-        for p in heal_pickups:
-            draw_heal_pickup(screen, p)
+    surf, (ox, oy) = sprites.ship(player_color)
+    px = int(lerp(player.prev_x, player.x, alpha))
+    py = int(lerp(player.prev_y, player.y, alpha))
+    screen.blit(surf, (px - ox, py - oy))
 
-        px = int(player.x)
-        py = int(player.y)
-        pygame.draw.polygon(
-            screen,
-            player_color,
-            [(px, py - 14), (px - 10, py + 12), (px + 10, py + 12)],
-        )
-        pygame.draw.circle(screen, (40, 40, 40), (px, py), 3)
 
-        hp_text = font.render(f"HP: {player.hp}/{player.max_hp}", True, (235, 235, 235))
-        screen.blit(hp_text, (16, 14))
+class Hud:
+    def __init__(self):
+        self.hp = HudLabel("HP: {}/{}", (16, 14))
+        self.level = HudLabel("Level: {}", (16, 86))
+        self.super_ready = HudLabel("SUPER (X): READY", (16, 62))
+        self.boss = HudLabel("BOSS HP: {}/{}", (16 + 10, HEIGHT - 16 - 22 - 22))
 
-        lvl_text = font.render(f"Level: {level}", True, (235, 235, 235))
-        screen.blit(lvl_text, (16, 86))
+    def draw(self, screen, font, game, show_super):
+        player = game.player
+        self.hp.draw(screen, font, player.hp, player.max_hp)
+        self.level.draw(screen, font, game.level)
 
         bar_x = 16
         bar_y = 42
@@ -695,10 +2402,11 @@ def main():
         fill_w = int(bar_w * (player.hp / player.max_hp)) if player.max_hp > 0 else 0
         pygame.draw.rect(screen, (90, 220, 120), (bar_x, bar_y, fill_w, bar_h), border_radius=3)
 
-        if player.super_cd <= 0.0 and state == "playing":
-            super_text = font.render("SUPER (X): READY", True, (235, 235, 235))
-            screen.blit(super_text, (16, 62))
+        if player.super_cd <= 0.0 and show_super:
+            self.super_ready.draw(screen, font)
 
+        boss_hp = game.boss_hp
+        boss_max_hp = game.boss_max_hp
         boss_bar_x = 16
         boss_bar_w = WIDTH - 32
         boss_bar_h = 22
@@ -724,43 +2432,1573 @@ def main():
             border_radius=6,
         )
 
-        boss_text = font.render(f"BOSS HP: {boss_hp}/{boss_max_hp}", True, (235, 235, 235))
-        screen.blit(boss_text, (boss_bar_x + 10, boss_bar_y - 22))
-
-        if state == "paused":
-            overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-            overlay.fill((0, 0, 0, 150))
-            screen.blit(overlay, (0, 0))
-            draw_text_center(screen, big_font, "PAUSED", HEIGHT * 0.45, (255, 255, 255))
-            draw_text_center(screen, font, "Press P to Resume", HEIGHT * 0.56, (220, 220, 220))
-
-        if state == "game_over":
-            overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-            overlay.fill((0, 0, 0, 170))
-            screen.blit(overlay, (0, 0))
-            draw_text_center(screen, big_font, "GAME OVER", HEIGHT * 0.42, (255, 255, 255))
-            draw_text_center(screen, font, "Press R to Restart", HEIGHT * 0.54, (220, 220, 220))
-            draw_text_center(screen, font, "Esc to Quit", HEIGHT * 0.60, (220, 220, 220))
-
-        if state == "upgrade":
-            overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-            overlay.fill((0, 0, 0, 170))
-            screen.blit(overlay, (0, 0))
-            draw_text_center(screen, big_font, "LEVEL CLEARED", HEIGHT * 0.28, (255, 255, 255))
-            draw_text_center(screen, font, "Choose 1 upgrade (click or press 1/2/3)", HEIGHT * 0.36, (220, 220, 220))
-
-            up_rects = [
-                pygame.Rect(WIDTH // 2 - 240, int(HEIGHT * 0.42), 480, 56),
-                pygame.Rect(WIDTH // 2 - 240, int(HEIGHT * 0.52), 480, 56),
-                pygame.Rect(WIDTH // 2 - 240, int(HEIGHT * 0.62), 480, 56),
-            ]
-            for i, r in enumerate(up_rects):
-                if i < len(upgrade_choices):
-                    uid, name, desc = upgrade_choices[i]
-                    draw_button(screen, font, r, f"{i+1}. {name}  ({desc})")
+        self.boss.draw(screen, font, boss_hp, boss_max_hp)
+
+
+BACKGROUND = (10, 10, 14)
+OVERLAYS = {}
+
 
+def fill_background(surface):
+    surface.fill(BACKGROUND)
+
+
+def overlay_surface(alpha):
+    overlay = OVERLAYS.get(alpha)
+    if overlay is None:
+        overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
+        overlay.fill((0, 0, 0, alpha))
+        OVERLAYS[alpha] = overlay
+    return overlay
+
+
+class StaticLayer:
+    def __init__(self):
+        self.backdrop = None
+        self.surface = None
+        self.key = None
+        self.hover = 0
+
+    def invalidate(self):
+        self.key = None
+
+    def present(self, screen, key, paint_backdrop, paint, hot_rects):
+        mouse_pos = pygame.mouse.get_pos()
+        hover = 0
+        for i in range(len(hot_rects)):
+            if hot_rects[i].collidepoint(mouse_pos):
+                hover |= 1 << i
+        if key != self.key:
+            if self.surface is None:
+                self.backdrop = pygame.Surface(screen.get_size()).convert()
+                self.surface = pygame.Surface(screen.get_size()).convert()
+            paint_backdrop(self.backdrop)
+            self.surface.blit(self.backdrop, (0, 0))
+            paint(self.surface)
+            screen.blit(self.surface, (0, 0))
+            pygame.display.flip()
+        elif hover != self.hover:
+            self.surface.blit(self.backdrop, (0, 0))
+            paint(self.surface)
+            changed = hover ^ self.hover
+            dirty = [rect for i, rect in enumerate(hot_rects) if changed >> i & 1]
+            for rect in dirty:
+                screen.blit(self.surface, rect, rect)
+            pygame.display.update(dirty)
+        self.key = key
+        self.hover = hover
+
+
+def menu_rects():
+    return (
+        pygame.Rect(WIDTH // 2 - 140, int(HEIGHT * 0.46), 280, 56),
+        pygame.Rect(WIDTH // 2 - 140, int(HEIGHT * 0.56), 280, 56),
+        pygame.Rect(WIDTH // 2 - 140, int(HEIGHT * 0.66), 280, 56),
+    )
+
+
+def draw_menu(surface, font, big_font, menu_font, buttons):
+    play_rect, options_rect, quit_rect = buttons
+    draw_text_center(surface, big_font, "BULLET HELL", HEIGHT * 0.26, (235, 235, 235))
+    draw_text_center(surface, font, "Z/Space: Shoot   X: Super   P: Pause", HEIGHT * 0.34, (200, 200, 210))
+    draw_button(surface, menu_font, play_rect, "PLAY")
+    draw_button(surface, menu_font, options_rect, "OPTIONS")
+    draw_button(surface, menu_font, quit_rect, "QUIT")
+
+
+def draw_options(surface, font, big_font, buttons, p_swatch, e_swatch, player_color, enemy_color, difficulty):
+    opt_back_rect, p_left, p_right, e_left, e_right, diff_easy, diff_normal, diff_hard = buttons
+    draw_text_center(surface, big_font, "OPTIONS", HEIGHT * 0.20, (235, 235, 235))
+
+    draw_button(surface, font, opt_back_rect, "BACK")
+
+    player_label = TEXT_CACHE.render(font, "Player Color", True, (235, 235, 235))
+    surface.blit(player_label, (WIDTH // 2 - 200, int(HEIGHT * 0.36) + 12))
+    draw_button(surface, font, p_left, "<")
+    pygame.draw.rect(surface, player_color, p_swatch, border_radius=8)
+    pygame.draw.rect(surface, (140, 140, 160), p_swatch, width=2, border_radius=8)
+    draw_button(surface, font, p_right, ">")
+
+    enemy_label = TEXT_CACHE.render(font, "Enemy Color", True, (235, 235, 235))
+    surface.blit(enemy_label, (WIDTH // 2 - 200, int(HEIGHT * 0.48) + 12))
+    draw_button(surface, font, e_left, "<")
+    pygame.draw.rect(surface, enemy_color, e_swatch, border_radius=8)
+    pygame.draw.rect(surface, (140, 140, 160), e_swatch, width=2, border_radius=8)
+    draw_button(surface, font, e_right, ">")
+
+    diff_label = TEXT_CACHE.render(font, "Difficulty", True, (235, 235, 235))
+    surface.blit(diff_label, (WIDTH // 2 - 200, int(HEIGHT * 0.62) + 14))
+
+    draw_button(surface, font, diff_easy, "EASY", enabled=True)
+    draw_button(surface, font, diff_normal, "NORMAL", enabled=True)
+    draw_button(surface, font, diff_hard, "HARD", enabled=True)
+
+    sel_rect = {"easy": diff_easy, "normal": diff_normal, "hard": diff_hard}[difficulty]
+    pygame.draw.rect(surface, (90, 220, 120), sel_rect, width=4, border_radius=10)
+
+    hint = TEXT_CACHE.render(
+        font,
+        f"Boss HP: {DIFFICULTIES[difficulty]['boss_hp']}   Heal every ~{DIFFICULTIES[difficulty]['heal_interval']:.0f}s",
+        True,
+        (200, 200, 210),
+    )
+    surface.blit(hint, (WIDTH // 2 - 200, int(HEIGHT * 0.72)))
+
+
+def draw_frozen_world(surface, sprites, hud, font, game, player_color, enemy_color, overlay_alpha, cheap=False):
+    fill_background(surface)
+    draw_world(surface, sprites, game, player_color, enemy_color, cheap=cheap)
+    hud.draw(surface, font, game, False)
+    if not cheap:
+        surface.blit(overlay_surface(overlay_alpha), (0, 0))
+
+
+class Scene:
+    name = None
+
+    def __init__(self, app):
+        self.app = app
+        self.hot = ()
+
+    def enter(self):
+        pass
+
+    def handle_event(self, event):
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+            self.app.running = False
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            self.click(event.pos)
+
+    def click(self, pos):
+        pass
+
+    def update(self, frame_dt):
+        self.app.idle()
+
+    def paint_backdrop(self, surface):
+        fill_background(surface)
+
+    def paint(self, surface):
+        pass
+
+    def render(self):
+        app = self.app
+        t0 = time.perf_counter_ns()
+        app.layer.present(app.screen, self, self.paint_backdrop, self.paint, self.hot)
+        PROFILER.add(PHASE_PRESENT, time.perf_counter_ns() - t0)
+
+
+class Menu(Scene):
+    name = "menu"
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.hot = menu_rects()
+
+    def click(self, pos):
+        app = self.app
+        play_rect, options_rect, quit_rect = self.hot
+        if play_rect.collidepoint(pos) and app.replay is None:
+            app.start_run()
+        elif options_rect.collidepoint(pos):
+            app.switch("options")
+        elif quit_rect.collidepoint(pos):
+            app.running = False
+
+    def paint(self, surface):
+        app = self.app
+        draw_menu(surface, app.font, app.big_font, app.menu_font, self.hot)
+
+
+class Options(Scene):
+    name = "options"
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.hot = (
+            pygame.Rect(18, 18, 120, 44),
+            pygame.Rect(WIDTH // 2 + 40, int(HEIGHT * 0.36), 46, 46),
+            pygame.Rect(WIDTH // 2 + 200, int(HEIGHT * 0.36), 46, 46),
+            pygame.Rect(WIDTH // 2 + 40, int(HEIGHT * 0.48), 46, 46),
+            pygame.Rect(WIDTH // 2 + 200, int(HEIGHT * 0.48), 46, 46),
+            pygame.Rect(WIDTH // 2 - 200, int(HEIGHT * 0.62), 120, 50),
+            pygame.Rect(WIDTH // 2 - 60, int(HEIGHT * 0.62), 120, 50),
+            pygame.Rect(WIDTH // 2 + 80, int(HEIGHT * 0.62), 120, 50),
+        )
+        self.p_swatch = pygame.Rect(WIDTH // 2 + 100, int(HEIGHT * 0.36), 90, 46)
+        self.e_swatch = pygame.Rect(WIDTH // 2 + 100, int(HEIGHT * 0.48), 90, 46)
+
+    def click(self, pos):
+        app = self.app
+        back, p_left, p_right, e_left, e_right, diff_easy, diff_normal, diff_hard = self.hot
+        if back.collidepoint(pos):
+            app.switch("menu")
+            return
+        if p_left.collidepoint(pos):
+            app.player_color_idx = (app.player_color_idx - 1) % len(COLOR_PALETTE)
+        elif p_right.collidepoint(pos):
+            app.player_color_idx = (app.player_color_idx + 1) % len(COLOR_PALETTE)
+        elif e_left.collidepoint(pos):
+            app.enemy_color_idx = (app.enemy_color_idx - 1) % len(COLOR_PALETTE)
+        elif e_right.collidepoint(pos):
+            app.enemy_color_idx = (app.enemy_color_idx + 1) % len(COLOR_PALETTE)
+        elif diff_easy.collidepoint(pos):
+            app.game.set_difficulty("easy")
+        elif diff_normal.collidepoint(pos):
+            app.game.set_difficulty("normal")
+        elif diff_hard.collidepoint(pos):
+            app.game.set_difficulty("hard")
+        else:
+            return
+        app.player_color = COLOR_PALETTE[app.player_color_idx]
+        app.enemy_color = COLOR_PALETTE[app.enemy_color_idx]
+        app.layer.invalidate()
+
+    def paint(self, surface):
+        app = self.app
+        draw_options(
+            surface,
+            app.font,
+            app.big_font,
+            self.hot,
+            self.p_swatch,
+            self.e_swatch,
+            app.player_color,
+            app.enemy_color,
+            app.game.difficulty,
+        )
+
+
+class Playing(Scene):
+    name = "playing"
+
+    def handle_event(self, event):
+        super().handle_event(event)
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_p:
+                self.app.switch("paused")
+            elif event.key == pygame.K_x:
+                self.app.inputs.super_pressed = True
+            elif event.key == pygame.K_BACKSPACE:
+                self.app.rewind(REWIND_SECONDS)
+
+    def update(self, frame_dt):
+        self.app.simulate(frame_dt)
+
+    def render(self):
+        app = self.app
+        if not app.governor.should_draw():
+            return
+        screen = app.screen
+        t0 = time.perf_counter_ns()
+        fill_background(screen)
+        draw_world(screen, app.sprites, app.game, app.player_color, app.enemy_color, app.alpha, app.governor.render_cheap)
+        app.hud.draw(screen, app.font, app.game, True)
+        if PROFILER.show_overlay:
+            PROFILER.draw_overlay(screen, app.profile_font, app.governor)
+        t1 = time.perf_counter_ns()
+        PROFILER.add(PHASE_RENDER, t1 - t0)
+        pygame.display.flip()
+        t2 = time.perf_counter_ns()
+        PROFILER.add(PHASE_PRESENT, t2 - t1)
+        app.governor.add_render((t2 - t0) / 1e6)
+
+
+class FrozenScene(Scene):
+    overlay_alpha = 170
+
+    def paint_backdrop(self, surface):
+        app = self.app
+        draw_frozen_world(
+            surface,
+            app.sprites,
+            app.hud,
+            app.font,
+            app.game,
+            app.player_color,
+            app.enemy_color,
+            self.overlay_alpha,
+            app.governor.cheap,
+        )
+
+
+class Paused(FrozenScene):
+    name = "paused"
+    overlay_alpha = 150
+
+    def handle_event(self, event):
+        super().handle_event(event)
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_p:
+            self.app.switch("playing")
+
+    def paint(self, surface):
+        draw_text_center(surface, self.app.big_font, "PAUSED", HEIGHT * 0.45, (255, 255, 255))
+        draw_text_center(surface, self.app.font, "Press P to Resume", HEIGHT * 0.56, (220, 220, 220))
+
+
+class Upgrade(FrozenScene):
+    name = "upgrade"
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.rects = (
+            pygame.Rect(WIDTH // 2 - 240, int(HEIGHT * 0.42), 480, 56),
+            pygame.Rect(WIDTH // 2 - 240, int(HEIGHT * 0.52), 480, 56),
+            pygame.Rect(WIDTH // 2 - 240, int(HEIGHT * 0.62), 480, 56),
+        )
+
+    def enter(self):
+        self.hot = self.rects[: len(self.app.game.upgrade_choices)]
+
+    def handle_event(self, event):
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_ESCAPE:
+                self.app.switch("menu")
+            elif event.key in (pygame.K_1, pygame.K_2, pygame.K_3):
+                self.app.inputs.upgrade_pick = event.key - pygame.K_1
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            self.click(event.pos)
+
+    def click(self, pos):
+        for i, rect in enumerate(self.hot):
+            if rect.collidepoint(pos):
+                self.app.inputs.upgrade_pick = i
+                break
+
+    def update(self, frame_dt):
+        # Picks are applied by step() so that replays record them.
+        self.app.simulate(frame_dt)
+
+    def paint(self, surface):
+        app = self.app
+        draw_text_center(surface, app.big_font, "LEVEL CLEARED", HEIGHT * 0.28, (255, 255, 255))
+        draw_text_center(surface, app.font, "Choose 1 upgrade (click or press 1/2/3)", HEIGHT * 0.36, (220, 220, 220))
+        for i, rect in enumerate(self.hot):
+            uid, name, desc = app.game.upgrade_choices[i]
+            draw_button(surface, app.font, rect, f"{i+1}. {name}  ({desc})")
+
+
+class GameOver(FrozenScene):
+    name = "game_over"
+
+    def handle_event(self, event):
+        super().handle_event(event)
+        if event.type == pygame.KEYDOWN and self.app.replay is None:
+            if event.key == pygame.K_r:
+                self.app.start_run()
+            elif event.key == pygame.K_c:
+                self.app.rewind(RETRY_SECONDS)
+
+    def paint(self, surface):
+        app = self.app
+        draw_text_center(surface, app.big_font, "GAME OVER", HEIGHT * 0.42, (255, 255, 255))
+        draw_text_center(surface, app.font, "Press R to Restart", HEIGHT * 0.54, (220, 220, 220))
+        if app.replay is None and len(app.snapshots):
+            draw_text_center(surface, app.font, "Press C to Retry from Checkpoint", HEIGHT * 0.60, (220, 220, 220))
+            draw_text_center(surface, app.font, "Esc to Quit", HEIGHT * 0.66, (220, 220, 220))
+        else:
+            draw_text_center(surface, app.font, "Esc to Quit", HEIGHT * 0.60, (220, 220, 220))
+
+
+SCENES = (Menu, Options, Playing, Paused, Upgrade, GameOver)
+
+
+class App:
+    def __init__(self, args, replay):
+        self.args = args
+        self.replay = replay
+        self.recorder = None
+        self.running = True
+
+        # Audio and joystick are never used, so only display and font are started.
+        pygame.display.init()
+        pygame.font.init()
+        pygame.display.set_caption("Bullet Hell")
+        self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        self.clock = pygame.time.Clock()
+        self.sprites = SpriteCache()
+        self.hud = Hud()
+        self.layer = StaticLayer()
+        self.fonts = FontBook(args.font)
+
+        if replay is not None:
+            self.game = GameState(motion=replay.motion, sim_hz=replay.sim_hz, continuous=replay.continuous)
+        else:
+            self.game = GameState(motion=args.motion, sim_hz=args.sim_hz)
+        self.inputs = InputFrame()
+        self.autopilot = BOTS[args.bot](args.seed) if args.autopilot and replay is None else None
+        self.snapshots = SnapshotRing()
+
+        self.player_color_idx = 0
+        self.enemy_color_idx = 4
+        self.player_color = COLOR_PALETTE[self.player_color_idx]
+        self.enemy_color = COLOR_PALETTE[self.enemy_color_idx]
+
+        self.governor = FrameGovernor(args.target_frame_ms, args.adaptive)
+        self.gc = GcControl(args.gc_control)
+        self.max_steps = self.governor.max_steps(self.game.sim_hz)
+        self.accumulator = 0.0
+        self.alpha = 1.0
+
+        self.scenes = {scene.name: scene(self) for scene in SCENES}
+        self.scene = None
+        if replay is not None:
+            self.game.set_difficulty(replay.difficulty)
+            self.game.reset_run(replay.seed)
+            self.switch("playing")
+        else:
+            self.switch("menu")
+
+    @property
+    def font(self):
+        return self.fonts.get(28)
+
+    @property
+    def big_font(self):
+        return self.fonts.get(72)
+
+    @property
+    def menu_font(self):
+        return self.fonts.get(44)
+
+    @property
+    def profile_font(self):
+        return self.fonts.get(20)
+
+    def switch(self, name):
+        scene = self.scenes[name]
+        if scene is not self.scene:
+            self.scene = scene
+            self.layer.invalidate()
+            self.gc.enter(name == "playing")
+            scene.enter()
+
+    def start_run(self):
+        self.game.reset_run(self.args.seed)
+        if self.args.record is not None:
+            game = self.game
+            self.recorder = InputRecorder(game.seed, game.difficulty, game.motion, game.sim_hz)
+        else:
+            self.recorder = None
+        self.snapshots.clear()
+        self.capture()
+        self.switch("playing")
+
+    def capture(self):
+        self.snapshots.capture(self.game, self.recorder.mark() if self.recorder is not None else None)
+
+    def rewind(self, seconds):
+        if self.replay is not None:
+            return
+        entry = self.snapshots.rewind(self.game, round(seconds * self.game.sim_hz))
+        if entry is None:
+            return
+        # Keep the recording in step with the timeline being resumed.
+        if self.recorder is not None and entry.tag is not None:
+            self.recorder.truncate(entry.tag)
+        self.accumulator = 0.0
+        self.alpha = 1.0
+        self.switch("playing")
+
+    def idle(self):
+        self.inputs.clear_edges()
+        self.accumulator = 0.0
+        self.alpha = 1.0
+
+    def simulate(self, frame_dt):
+        game = self.game
+        inputs = self.inputs
+        replay = self.replay
+        sim_dt = game.dt
+        self.accumulator += frame_dt
+        steps = 0
+        while self.accumulator >= sim_dt and steps < self.max_steps:
+            if replay is not None and not replay.read(inputs):
+                break
+            if self.autopilot is not None:
+                self.autopilot.read(game, inputs)
+            if self.recorder is not None:
+                self.recorder.record(inputs)
+            step(game, inputs, sim_dt)
+            inputs.clear_edges()
+            if replay is None and game.mode == "playing" and self.snapshots.advance():
+                self.capture()
+            self.accumulator -= sim_dt
+            steps += 1
+            if game.mode != "playing":
+                break
+        if steps == self.max_steps:
+            # Spiral-of-death guard: drop the backlog instead of chasing it.
+            self.accumulator = min(self.accumulator, sim_dt)
+        if game.mode == "game_over" and self.scene.name != "game_over" and self.recorder is not None:
+            self.recorder.save(self.args.record)
+        self.switch(game.mode)
+        if game.mode != "playing" or (replay is not None and replay.done):
+            self.accumulator = 0.0
+            self.alpha = 1.0
+        else:
+            self.alpha = self.accumulator / sim_dt
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Bullet hell boss ladder.")
+    parser.add_argument("--seed", type=int, help="seed every run with this value")
+    parser.add_argument("--record", metavar="PATH", help="record the inputs of the latest run to PATH")
+    parser.add_argument("--replay", metavar="PATH", help="re-simulate a recorded run")
+    parser.add_argument("--headless", action="store_true", help="with --replay: simulate without a window")
+    parser.add_argument(
+        "--motion",
+        choices=MOTION_MODES,
+        default="integrate",
+        help="bullet motion: integrate every tick, or evaluate analytically from spawn time",
+    )
+    parser.add_argument(
+        "--sim-hz",
+        type=int,
+        default=SIM_HZ,
+        help="fixed simulation tick rate in Hz (default: %(default)s)",
+    )
+    parser.add_argument("--profile", action="store_true", help="show the frame profiler overlay (toggle with F3)")
+    parser.add_argument("--profile-out", metavar="PATH", help="stream per-frame profiler records to PATH as JSON Lines")
+    parser.add_argument(
+        "--startup-profile",
+        action="store_true",
+        help="print import, init and first-frame timings once the first frame is shown",
+    )
+    parser.add_argument(
+        "--gc-control",
+        action="store_true",
+        help="freeze startup objects and only run the cyclic GC outside gameplay",
+    )
+    parser.add_argument(
+        "--hitch-log",
+        metavar="PATH",
+        help="log frames over budget with GC and allocation details to PATH as JSON Lines ('-' for stderr)",
+    )
+    parser.add_argument(
+        "--hitch-trace",
+        action="store_true",
+        help="with --hitch-log: trace allocation sites in short windows (slows those frames down)",
+    )
+    parser.add_argument("--telemetry", metavar="DIR", help="record per-frame gameplay telemetry as memory-mapped columns in DIR")
+    parser.add_argument("--telemetry-summary", metavar="DIR", help="summarise a telemetry recording and exit")
+    parser.add_argument("--font", metavar="NAME", help="system font to use instead of the bundled default")
+    parser.add_argument("--bench", action="store_true", help="run the headless benchmark suite and exit")
+    parser.add_argument(
+        "--bench-scenarios",
+        default=",".join(BENCH_SCENARIOS),
+        help=f"comma-separated scenarios to run (default: {','.join(BENCH_SCENARIOS)})",
+    )
+    parser.add_argument("--bench-frames", type=int, default=BENCH_FRAMES, help="measured frames per scenario")
+    parser.add_argument("--bench-out", metavar="PATH", default="bench_results.json", help="where to write results")
+    parser.add_argument("--bench-baseline", metavar="PATH", help="compare against a stored results file")
+    parser.add_argument(
+        "--bench-threshold",
+        type=float,
+        default=BENCH_THRESHOLD,
+        help="allowed slowdown vs the baseline as a fraction (default: %(default)s)",
+    )
+    parser.add_argument("--sweep", type=int, metavar="N", help="run N headless bot runs per configuration and exit")
+    parser.add_argument(
+        "--sweep-difficulties",
+        default=",".join(DIFFICULTY_ORDER),
+        help="comma-separated difficulties to sweep (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--sweep-growth",
+        default=str(BOSS_HP_GROWTH),
+        help="comma-separated boss HP growth factors to sweep (default: %(default)s)",
+    )
+    parser.add_argument("--sweep-jobs", type=int, help="worker processes (default: one per core)")
+    parser.add_argument("--sweep-max-level", type=int, default=30, help="stop a run after clearing this level")
+    parser.add_argument(
+        "--sweep-minutes",
+        type=float,
+        default=SWEEP_MAX_MINUTES,
+        help="cap on simulated minutes per run (default: %(default)s)",
+    )
+    parser.add_argument("--sweep-out", metavar="PATH", help="write the summary and per-run results as JSON")
+    parser.add_argument("--bot", choices=sorted(BOTS), default="lookahead", help="bot used by --sweep and --autopilot")
+    parser.add_argument("--autopilot", action="store_true", help="let the bot play instead of the keyboard")
+    parser.add_argument(
+        "--serve",
+        nargs="?",
+        const=NET_DEFAULT_ADDRESS,
+        metavar="ADDR",
+        help=f"run a headless game server on host:port or unix:PATH (default: {NET_DEFAULT_ADDRESS})",
+    )
+    parser.add_argument("--serve-ticks", type=int, metavar="N", help="stop the server after N ticks")
+    parser.add_argument(
+        "--difficulty", choices=DIFFICULTY_ORDER, default=DEFAULT_DIFFICULTY, help="difficulty of --serve runs"
+    )
+    parser.add_argument(
+        "--connect",
+        nargs="?",
+        const=NET_DEFAULT_ADDRESS,
+        metavar="ADDR",
+        help=f"watch a game server (default: {NET_DEFAULT_ADDRESS})",
+    )
+    parser.add_argument("--drive", action="store_true", help="with --connect: send keyboard input to the server")
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="skip drawing frames (never simulation) and shed effects when over the frame budget",
+    )
+    parser.add_argument(
+        "--target-frame-ms",
+        type=float,
+        default=1000.0 / FPS,
+        help="frame time budget in ms (default: %(default).1f)",
+    )
+    args = parser.parse_args(argv)
+    if args.sim_hz < 1:
+        parser.error("--sim-hz must be at least 1")
+    if args.target_frame_ms <= 0:
+        parser.error("--target-frame-ms must be positive")
+    if args.seed is not None and not 0 <= args.seed <= 0xFFFFFFFF:
+        parser.error("--seed must be between 0 and 4294967295")
+    return args
+
+
+SWEEP_SEED = 1
+SWEEP_MAX_MINUTES = 15.0
+
+
+def sweep_run(job):
+    difficulty, growth, seed, max_level, max_minutes, bot_name, sim_hz = job
+    game = GameState(difficulty, seed, sim_hz=sim_hz)
+    game.boss_hp_growth = growth
+    game.reset_run(seed)
+    bot = BOTS[bot_name](seed)
+    inputs = InputFrame()
+    max_ticks = int(max_minutes * 60.0 * sim_hz)
+    ttk = []
+    damage = []
+    upgrades = []
+    for _ in range(max_ticks):
+        bot.read(game, inputs)
+        if game.mode == "upgrade":
+            upgrades.append(game.upgrade_choices[inputs.upgrade_pick][0])
+        step(game, inputs, game.dt)
+        inputs.clear_edges()
+        if game.mode == "upgrade":
+            ttk.append(game.t_global)
+            damage.append(game.level_damage)
+            if game.level >= max_level:
+                break
+        elif game.mode == "game_over":
+            damage.append(game.level_damage)
+            break
+    return {
+        "difficulty": difficulty,
+        "growth": growth,
+        "seed": seed,
+        "level": game.level,
+        "died": game.mode == "game_over",
+        "ttk": ttk,
+        "damage": damage,
+        "upgrades": upgrades,
+    }
+
+
+def summarize_sweep(runs):
+    groups = {}
+    for run in runs:
+        groups.setdefault((run["difficulty"], run["growth"]), []).append(run)
+
+    summary = []
+    for (difficulty, growth), group in groups.items():
+        levels = np.array([r["level"] for r in group])
+        deaths = sum(r["died"] for r in group)
+        depth = max(len(r["ttk"]) for r in group)
+        ttk_by_level = []
+        dmg_by_level = []
+        for i in range(depth):
+            ttk = [r["ttk"][i] for r in group if len(r["ttk"]) > i]
+            dmg = [r["damage"][i] for r in group if len(r["damage"]) > i]
+            ttk_by_level.append(float(np.mean(ttk)))
+            dmg_by_level.append(float(np.mean(dmg)))
+        picks = Counter(u for r in group for u in r["upgrades"])
+        total_picks = sum(picks.values()) or 1
+        summary.append(
+            {
+                "difficulty": difficulty,
+                "growth": growth,
+                "runs": len(group),
+                "death_rate": deaths / len(group),
+                "level_mean": float(levels.mean()),
+                "level_p50": float(np.percentile(levels, 50)),
+                "level_max": int(levels.max()),
+                "ttk_by_level": ttk_by_level,
+                "damage_by_level": dmg_by_level,
+                "upgrade_mix": {uid: picks[uid] / total_picks for uid, _, _ in UPGRADE_POOL},
+            }
+        )
+    return summary
+
+
+def print_sweep_summary(summary):
+    print(f"{'difficulty':<10} {'growth':>6} {'runs':>6} {'died':>6} {'lvl avg':>8} {'p50':>5} {'max':>5}")
+    for s in summary:
+        print(
+            f"{s['difficulty']:<10} {s['growth']:>6.2f} {s['runs']:>6} {s['death_rate']:>6.0%} "
+            f"{s['level_mean']:>8.2f} {s['level_p50']:>5.0f} {s['level_max']:>5}"
+        )
+    for s in summary:
+        print()
+        print(f"{s['difficulty']} x{s['growth']:.2f}")
+        print(f"  {'level':>5} {'ttk s':>8} {'damage':>8}")
+        for i, (ttk, dmg) in enumerate(zip(s["ttk_by_level"], s["damage_by_level"])):
+            print(f"  {i + 1:>5} {ttk:>8.1f} {dmg:>8.1f}")
+        mix = "  ".join(f"{uid} {share:.0%}" for uid, share in s["upgrade_mix"].items())
+        print(f"  upgrades: {mix}")
+
+
+def run_sweep(args):
+    difficulties = [d.strip() for d in args.sweep_difficulties.split(",") if d.strip()]
+    unknown = [d for d in difficulties if d not in DIFFICULTIES]
+    if unknown:
+        print(f"unknown difficulty: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    growths = [float(g) for g in args.sweep_growth.split(",")]
+    base_seed = SWEEP_SEED if args.seed is None else args.seed
+    jobs = [
+        (difficulty, growth, (base_seed + i) & 0xFFFFFFFF, args.sweep_max_level, args.sweep_minutes, args.bot, args.sim_hz)
+        for difficulty in difficulties
+        for growth in growths
+        for i in range(args.sweep)
+    ]
+
+    workers = args.sweep_jobs or os.cpu_count() or 1
+    chunksize = max(1, len(jobs) // (workers * 8))
+    start = time.perf_counter()
+    import concurrent.futures
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        runs = list(pool.map(sweep_run, jobs, chunksize=chunksize))
+    elapsed = time.perf_counter() - start
+
+    summary = summarize_sweep(runs)
+    print_sweep_summary(summary)
+    print()
+    print(f"{len(runs)} runs on {workers} workers in {elapsed:.1f} s ({len(runs) / elapsed:.1f} runs/s)")
+    if args.sweep_out:
+        with open(args.sweep_out, "w") as f:
+            json.dump({"summary": summary, "runs": runs}, f, indent=2)
+        print(f"results written to {args.sweep_out}")
+    return 0
+
+
+def run_headless_replay(path):
+    replay = InputReplay.load(path)
+    start = time.perf_counter()
+    game = simulate_replay(replay)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{path}: {replay.ticks} ticks in {elapsed * 1000.0:.1f} ms, "
+        f"level {game.level}, hp {game.player.hp}, boss hp {game.boss_hp}, "
+        f"mode {game.mode}, digest {state_digest(game)}"
+    )
+
+
+def print_telemetry_summary(path):
+    log = TelemetryLog(path)
+    if not len(log):
+        print(f"{path}: no frames recorded")
+        return
+    ms = log["frame_ms"]
+    p50, p95, p99 = np.percentile(ms, (50, 95, 99))
+    print(
+        f"{path}: {len(log)} frames over {float(log['t'][-1]):.1f} s, "
+        f"frame ms p50 {p50:.2f} / p95 {p95:.2f} / p99 {p99:.2f}"
+    )
+    levels = log["level"]
+    bullets = log["enemy_bullets"]
+    print(f"{'level':>5} {'frames':>8} {'ms p95':>8} {'bullets':>8} {'max':>6}")
+    for level in np.unique(levels).tolist():
+        sel = levels == level
+        print(
+            f"{level:>5} {int(sel.sum()):>8} {float(np.percentile(ms[sel], 95)):>8.2f} "
+            f"{float(bullets[sel].mean()):>8.1f} {int(bullets[sel].max()):>6}"
+        )
+    for name in log.pattern_names:
+        print(f"{name}: active {float(log.pattern_active(name).mean()) * 100:.1f}% of frames")
+
+
+BENCH_SEED = 20240601
+BENCH_FRAMES = 600
+BENCH_WARMUP = 60
+BENCH_THRESHOLD = 0.10
+BENCH_MIN_DELTA_MS = 0.05
+BENCH_FIELD_SIZE = 10000
+
+
+def bench_invulnerable(game):
+    game.player.max_hp = game.player.hp = 10**9
+    game.boss_max_hp = game.boss_hp = 10**9
+
+
+def bench_setup_boss(game, np_rng):
+    game.jump_to_level(30, PATTERN_POOL)
+    bench_invulnerable(game)
+
+
+def bench_setup_field(game, np_rng):
+    game.jump_to_level(1, ())
+    bench_invulnerable(game)
+
+
+def bench_top_up_field(game, np_rng):
+    bullets = game.enemy_bullets
+    missing = BENCH_FIELD_SIZE - len(bullets)
+    if missing > 0:
+        ang = np_rng.uniform(0.0, math.tau, missing)
+        spd = np_rng.uniform(40.0, 160.0, missing)
+        bullets.spawn_batch(
+            np_rng.uniform(0.0, WIDTH, missing),
+            np_rng.uniform(0.0, HEIGHT, missing),
+            np.cos(ang) * spd,
+            np.sin(ang) * spd,
+            KIND_ENEMY,
+        )
+
+
+def bench_setup_heal_flood(game, np_rng):
+    game.jump_to_level(1, ())
+    bench_invulnerable(game)
+    game.heal_interval = game.heal_spawn_timer = 0.01
+
+
+class BenchScenario:
+    def __init__(self, name, setup=None, per_frame=None, idle_menu=False):
+        self.name = name
+        self.setup = setup
+        self.per_frame = per_frame
+        self.idle_menu = idle_menu
+
+
+BENCH_SCENARIOS = {
+    "boss30": BenchScenario("boss30", bench_setup_boss),
+    "field10k": BenchScenario("field10k", bench_setup_field, bench_top_up_field),
+    "heal_flood": BenchScenario("heal_flood", bench_setup_heal_flood),
+    "menu_idle": BenchScenario("menu_idle", idle_menu=True),
+}
+
+
+def bench_inputs(frame, inputs):
+    phase = (frame // 45) % 4
+    inputs.left = phase == 0
+    inputs.up = phase == 1
+    inputs.right = phase == 2
+    inputs.down = phase == 3
+    inputs.shoot = True
+    inputs.super_pressed = frame % 240 == 0
+
+
+def run_bench_scenario(scenario, frames, screen, fonts, motion):
+    font, big_font, menu_font = fonts
+    game = GameState(seed=BENCH_SEED, motion=motion)
+    np_rng = np.random.default_rng(BENCH_SEED)
+    inputs = InputFrame()
+    sprites = SpriteCache()
+    hud = Hud()
+    layer = StaticLayer()
+    buttons = menu_rects()
+    if scenario.setup is not None:
+        scenario.setup(game, np_rng)
+    steps_per_frame = max(1, SIM_HZ // FPS)
+
+    def paint_menu(surf):
+        draw_menu(surf, font, big_font, menu_font, buttons)
+
+    update_ms = np.zeros(frames)
+    render_ms = np.zeros(frames)
+    for frame in range(-BENCH_WARMUP, frames):
+        pygame.event.pump()
+        t0 = time.perf_counter_ns()
+        if not scenario.idle_menu:
+            if scenario.per_frame is not None:
+                scenario.per_frame(game, np_rng)
+            for _ in range(steps_per_frame):
+                bench_inputs(frame, inputs)
+                step(game, inputs, SIM_DT)
+                inputs.clear_edges()
+        t1 = time.perf_counter_ns()
+        if scenario.idle_menu:
+            layer.present(screen, ("menu",), fill_background, paint_menu, buttons)
+        else:
+            fill_background(screen)
+            draw_world(screen, sprites, game, COLOR_PALETTE[0], COLOR_PALETTE[4], 0.5)
+            hud.draw(screen, font, game, True)
+            pygame.display.flip()
+        t2 = time.perf_counter_ns()
+        if frame >= 0:
+            update_ms[frame] = (t1 - t0) / 1e6
+            render_ms[frame] = (t2 - t1) / 1e6
+
+    return {
+        "frames": frames,
+        "update_ms": float(update_ms.mean()),
+        "update_p95_ms": float(np.percentile(update_ms, 95)),
+        "render_ms": float(render_ms.mean()),
+        "render_p95_ms": float(np.percentile(render_ms, 95)),
+        "player_bullets": len(game.player_bullets),
+        "enemy_bullets": len(game.enemy_bullets),
+        "heal_pickups": len(game.heal_pickups),
+    }
+
+
+def compare_bench(results, baseline, threshold):
+    regressions = []
+    for name, cur in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        for key in ("update_ms", "render_ms"):
+            limit = base[key] * (1.0 + threshold)
+            if cur[key] > limit and cur[key] - base[key] > BENCH_MIN_DELTA_MS:
+                regressions.append(f"{name}.{key}: {cur[key]:.3f} ms vs baseline {base[key]:.3f} ms")
+    return regressions
+
+
+def run_bench(args):
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    names = [name.strip() for name in args.bench_scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in BENCH_SCENARIOS]
+    if unknown:
+        print(f"unknown benchmark scenario(s): {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    font_book = FontBook(args.font)
+    fonts = (font_book.get(28), font_book.get(72), font_book.get(44))
+
+    results = {
+        "seed": BENCH_SEED,
+        "sim_hz": SIM_HZ,
+        "motion": args.motion,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pygame": pygame.version.ver,
+        "scenarios": {},
+    }
+    print(f"{'scenario':<12} {'update ms':>10} {'p95':>8} {'render ms':>10} {'p95':>8} {'bullets':>8}")
+    for name in names:
+        r = run_bench_scenario(BENCH_SCENARIOS[name], args.bench_frames, screen, fonts, args.motion)
+        results["scenarios"][name] = r
+        print(
+            f"{name:<12} {r['update_ms']:>10.3f} {r['update_p95_ms']:>8.3f} "
+            f"{r['render_ms']:>10.3f} {r['render_p95_ms']:>8.3f} {r['enemy_bullets']:>8}"
+        )
+    pygame.quit()
+
+    with open(args.bench_out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {args.bench_out}")
+
+    if args.bench_baseline:
+        with open(args.bench_baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_bench(results, baseline, args.bench_threshold)
+        if regressions:
+            print(f"regressions over {args.bench_threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"no regressions over {args.bench_threshold:.0%} against {args.bench_baseline}")
+    return 0
+
+
+NET_DEFAULT_ADDRESS = "127.0.0.1:7777"
+NET_FRAME = struct.Struct("<BI")
+NET_HELLO = 1
+NET_INPUT = 2
+NET_SNAPSHOT = 3
+NET_ROLE_VIEW = 0
+NET_ROLE_DRIVE = 1
+NET_MODES = ("playing", "upgrade", "game_over")
+NET_NO_BASE = 0xFFFFFFFF
+# tick, baseline, mode, level, hp, max hp, boss hp, boss max hp, super ready,
+# upgrade choices, player x/y, boss x/y, enemy/player bullet and pickup counts.
+NET_HEADER = struct.Struct("<IIBHiiqqB3B4fIIH")
+# Boss HP grows geometrically with level; int64 covers it until about level
+# 130, and anything past that is sent clamped.
+NET_HP_MAX = (1 << 63) - 1
+NET_INPUT_MSG = struct.Struct("<Bb")
+NET_SCALE = 8.0
+NET_SEND_HZ = 60
+NET_MAX_BACKLOG = 1 << 20
+NET_REPORT_S = 5.0
+NET_RESTART_S = 2.0
+
+
+def parse_address(text):
+    import socket
+
+    if text.startswith("unix:"):
+        return socket.AF_UNIX, text[len("unix:") :]
+    host, _, port = text.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def net_frame(kind, payload):
+    return NET_FRAME.pack(kind, len(payload)) + payload
+
+
+def net_read_frames(buf):
+    frames = []
+    pos = 0
+    while len(buf) - pos >= NET_FRAME.size:
+        kind, size = NET_FRAME.unpack_from(buf, pos)
+        end = pos + NET_FRAME.size + size
+        if len(buf) < end:
+            break
+        frames.append((kind, bytes(buf[pos + NET_FRAME.size : end])))
+        pos = end
+    del buf[:pos]
+    return frames
+
+
+def quantise(xs, ys):
+    return np.rint(np.column_stack((xs, ys)) * NET_SCALE).astype(np.int16).ravel()
+
+
+def net_state(game, tick):
+    # Positions are sent as int16 in 1/8 px; the playfield plus cull margins
+    # fits with room to spare.
+    player = game.player
+    enemy = game.enemy
+    parts = []
+    counts = []
+    for bullets in (game.enemy_bullets, game.player_bullets):
+        bullets.sync()
+        live = bullets.live()
+        parts.append(quantise(bullets.x[live], bullets.y[live]))
+        counts.append(len(bullets))
+    pickups = game.heal_pickups
+    parts.append(quantise([p.x for p in pickups], [p.y for p in pickups]))
+    live = game.player_bullets.live()
+    parts.append(game.player_bullets.kind[live].astype(np.int16))
+    choices = [UPGRADE_POOL.index(c) for c in game.upgrade_choices] if game.mode == "upgrade" else []
+    choices += [255] * (3 - len(choices))
+    header = [
+        tick,
+        NET_NO_BASE,
+        NET_MODES.index(game.mode),
+        game.level,
+        player.hp,
+        player.max_hp,
+        min(game.boss_hp, NET_HP_MAX),
+        min(game.boss_max_hp, NET_HP_MAX),
+        player.can_super(),
+        *choices,
+        player.x,
+        player.y,
+        enemy.x,
+        enemy.y,
+        counts[0],
+        counts[1],
+        len(pickups),
+    ]
+    return header, np.concatenate(parts)
+
+
+def net_predict(base, prev):
+    # Bullets keep their rows between snapshots and fly straight, so extrapolating
+    # the last two snapshots predicts most values to within a rounding step.
+    if base is None or prev is None:
+        return base
+    pred = base.copy()
+    n = min(base.size, prev.size)
+    pred[:n] += base[:n] - prev[:n]
+    return pred
+
+
+def net_encode(body, pred):
+    delta = body.copy()
+    if pred is not None:
+        n = min(body.size, pred.size)
+        delta[:n] -= pred[:n]
+    # Residuals are small, so splitting low and high bytes into separate planes
+    # leaves a high plane that is almost all 0x00/0xff.
+    return zlib.compress(delta.view(np.uint8).reshape(-1, 2).T.tobytes(), 1)
+
+
+def net_decode(data, pred):
+    planes = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(2, -1)
+    body = planes.T.copy().view(np.int16).ravel()
+    if pred is not None:
+        n = min(body.size, pred.size)
+        body[:n] += pred[:n]
+    return body
+
+
+def apply_net_state(game, header, body):
+    (
+        _,
+        _,
+        mode,
+        game.level,
+        hp,
+        max_hp,
+        game.boss_hp,
+        game.boss_max_hp,
+        super_ready,
+        c0,
+        c1,
+        c2,
+        px,
+        py,
+        ex,
+        ey,
+        n_enemy,
+        n_player,
+        n_pickups,
+    ) = header
+    game.mode = NET_MODES[mode]
+    game.upgrade_choices = [UPGRADE_POOL[c] for c in (c0, c1, c2) if c != 255]
+    player = game.player
+    player.hp = hp
+    player.max_hp = max_hp
+    player.super_cd = 0.0 if super_ready else 1.0
+    player.x = player.prev_x = px
+    player.y = player.prev_y = py
+    enemy = game.enemy
+    enemy.x = enemy.prev_x = ex
+    enemy.y = enemy.prev_y = ey
+
+    xy = body.astype(np.float64) / NET_SCALE
+    i = 2 * n_enemy
+    j = i + 2 * n_player
+    k = j + 2 * n_pickups
+    enemy_xy = xy[:i].reshape(-1, 2)
+    player_xy = xy[i:j].reshape(-1, 2)
+    kinds = body[k : k + n_player]
+    game.enemy_bullets.clear()
+    zero = np.zeros(n_enemy)
+    game.enemy_bullets.spawn_batch(enemy_xy[:, 0], enemy_xy[:, 1], zero, zero, KIND_ENEMY)
+    game.player_bullets.clear()
+    for kind in (KIND_PLAYER, KIND_SUPER):
+        sel = player_xy[kinds == kind]
+        zero = np.zeros(len(sel))
+        game.player_bullets.spawn_batch(sel[:, 0], sel[:, 1], zero, zero, kind)
+    game.heal_pickups.clear()
+    for x, y in xy[j:k].reshape(-1, 2).tolist():
+        p = game.heal_pickups.acquire()
+        p.reset(x)
+        p.y = p.prev_y = y
+
+
+class NetClient:
+    def __init__(self, sock):
+        self.sock = sock
+        self.role = NET_ROLE_VIEW
+        self.rbuf = bytearray()
+        self.wbuf = bytearray()
+        self.base_tick = NET_NO_BASE
+        self.prev_tick = NET_NO_BASE
+
+    def flush(self):
+        if not self.wbuf:
+            return
+        try:
+            sent = self.sock.send(self.wbuf)
+        except BlockingIOError:
+            return
+        del self.wbuf[:sent]
+
+
+class NetStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.ticks = 0
+        self.sim_ns = 0
+        self.sent = 0
+        self.raw = 0
+        self.snapshots = 0
+        self.client_ns = 0
+
+    def report(self, tick, clients):
+        ticks = max(self.ticks, 1)
+        snaps = max(self.snapshots, 1)
+        print(
+            f"server: tick {tick}, {clients} client(s), sim {self.sim_ns / ticks / 1e6:.3f} ms/tick, "
+            f"sent {self.sent / ticks / 1024:.2f} KB/tick ({self.sent / snaps / 1024:.2f} KB per client snapshot, "
+            f"{self.raw / max(self.sent, 1):.1f}x vs raw), "
+            f"cpu {self.client_ns / snaps / 1e6:.3f} ms per client snapshot",
+            flush=True,
+        )
+        self.reset()
+
+
+class GameServer:
+    def __init__(self, args):
+        self.args = args
+        self.game = GameState(args.difficulty, seed=args.seed, motion=args.motion, sim_hz=args.sim_hz)
+        self.game.reset_run(args.seed)
+        self.inputs = InputFrame()
+        self.bot = BOTS[args.bot](args.seed)
+        self.clients = []
+        self.tick = 0
+        self.bodies = {}
+        self.stats = NetStats()
+        self.restart_at = None
+
+        import selectors
+        import socket
+
+        family, address = parse_address(args.serve)
+        self.listener = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_UNIX:
+            if os.path.exists(address):
+                os.unlink(address)
+        else:
+            self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(address)
+        self.listener.listen()
+        self.listener.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self.address = address
+
+    def driver(self):
+        for client in self.clients:
+            if client.role == NET_ROLE_DRIVE:
+                return client
+        return None
+
+    def accept(self):
+        import selectors
+        import socket
+
+        sock, _ = self.listener.accept()
+        sock.setblocking(False)
+        if sock.family != socket.AF_UNIX:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client = NetClient(sock)
+        self.clients.append(client)
+        self.selector.register(sock, selectors.EVENT_READ, client)
+
+    def drop(self, client):
+        self.selector.unregister(client.sock)
+        client.sock.close()
+        self.clients.remove(client)
+
+    def receive(self, client):
+        try:
+            data = client.sock.recv(65536)
+        except BlockingIOError:
+            return
+        except ConnectionError:
+            data = b""
+        if not data:
+            self.drop(client)
+            return
+        client.rbuf += data
+        for kind, payload in net_read_frames(client.rbuf):
+            if kind == NET_HELLO and len(payload) == 1 and payload[0] in (NET_ROLE_VIEW, NET_ROLE_DRIVE):
+                client.role = payload[0]
+            elif kind == NET_INPUT and len(payload) == NET_INPUT_MSG.size:
+                if client is not self.driver():
+                    continue
+                bits, pick = NET_INPUT_MSG.unpack(payload)
+                inputs = self.inputs
+                for i, name in enumerate(INPUT_BITS):
+                    if name != "super_pressed":
+                        setattr(inputs, name, bool(bits & (1 << i)))
+                # Edges are latched until the next tick consumes them.
+                if bits & (1 << INPUT_BITS.index("super_pressed")):
+                    inputs.super_pressed = True
+                if pick >= 0:
+                    inputs.upgrade_pick = pick
+            else:
+                # Not a frame this protocol sends; don't let it take the server down.
+                self.drop(client)
+                return
+        if len(client.rbuf) > NET_MAX_BACKLOG:
+            self.drop(client)
+
+    def step(self, now):
+        game = self.game
+        t0 = time.perf_counter_ns()
+        if game.mode == "game_over":
+            if self.restart_at is None:
+                self.restart_at = now + NET_RESTART_S
+            elif now >= self.restart_at:
+                self.restart_at = None
+                game.reset_run(self.args.seed)
+        else:
+            if self.driver() is None:
+                self.bot.read(game, self.inputs)
+            step(game, self.inputs, game.dt)
+            self.inputs.clear_edges()
+        self.tick += 1
+        self.stats.ticks += 1
+        self.stats.sim_ns += time.perf_counter_ns() - t0
+
+    def broadcast(self):
+        if not self.clients:
+            return
+        header, body = net_state(self.game, self.tick)
+        messages = {}
+        for client in self.clients:
+            t0 = time.perf_counter_ns()
+            if len(client.wbuf) > NET_MAX_BACKLOG:
+                # A slow viewer skips snapshots; its baselines stay the last ones
+                # it was sent, so the next delta still decodes.
+                continue
+            bases = (client.base_tick, client.prev_tick)
+            message = messages.get(bases)
+            if message is None:
+                base = self.bodies.get(client.base_tick)
+                header[1] = client.base_tick if base is not None else NET_NO_BASE
+                pred = net_predict(base, self.bodies.get(client.prev_tick))
+                message = net_frame(NET_SNAPSHOT, NET_HEADER.pack(*header) + net_encode(body, pred))
+                messages[bases] = message
+            client.prev_tick = client.base_tick if client.base_tick in self.bodies else NET_NO_BASE
+            client.base_tick = self.tick
+            client.wbuf += message
+            client.flush()
+            self.stats.sent += len(message)
+            self.stats.raw += NET_FRAME.size + NET_HEADER.size + body.nbytes
+            self.stats.snapshots += 1
+            self.stats.client_ns += time.perf_counter_ns() - t0
+        self.bodies[self.tick] = body
+        in_use = {tick for client in self.clients for tick in (client.base_tick, client.prev_tick)}
+        for tick in [t for t in self.bodies if t not in in_use]:
+            del self.bodies[tick]
+
+    def run(self):
+        args = self.args
+        dt = self.game.dt
+        send_every = max(1, round(self.game.sim_hz / NET_SEND_HZ))
+        max_steps = max_sim_steps(self.game.sim_hz)
+        print(f"serving on {args.serve}", flush=True)
+        next_tick = time.perf_counter()
+        next_report = next_tick + NET_REPORT_S
+        try:
+            while args.serve_ticks is None or self.tick < args.serve_ticks:
+                timeout = max(0.0, next_tick - time.perf_counter())
+                for key, _ in self.selector.select(timeout):
+                    if key.data is None:
+                        self.accept()
+                    else:
+                        self.receive(key.data)
+                now = time.perf_counter()
+                steps = 0
+                while now >= next_tick and steps < max_steps:
+                    self.step(now)
+                    if self.tick % send_every == 0:
+                        self.broadcast()
+                    next_tick += dt
+                    steps += 1
+                if steps == max_steps:
+                    next_tick = max(next_tick, now)
+                for client in self.clients:
+                    client.flush()
+                if now >= next_report:
+                    self.stats.report(self.tick, len(self.clients))
+                    next_report = now + NET_REPORT_S
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stats.report(self.tick, len(self.clients))
+            for client in list(self.clients):
+                self.drop(client)
+            self.listener.close()
+            # Unix socket addresses are paths; TCP ones are (host, port) tuples.
+            if isinstance(self.address, str) and os.path.exists(self.address):
+                os.unlink(self.address)
+        return 0
+
+
+def run_server(args):
+    return GameServer(args).run()
+
+
+def run_viewer(args):
+    import socket
+
+    family, address = parse_address(args.connect)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.connect(address)
+    if family != socket.AF_UNIX:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    role = NET_ROLE_DRIVE if args.drive else NET_ROLE_VIEW
+    sock.sendall(net_frame(NET_HELLO, bytes((role,))))
+    sock.setblocking(False)
+
+    pygame.display.init()
+    pygame.font.init()
+    pygame.display.set_caption("Bullet Hell (viewer)")
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    clock = pygame.time.Clock()
+    sprites = SpriteCache()
+    hud = Hud()
+    fonts = FontBook(args.font)
+    game = GameState()
+    inputs = InputFrame()
+    rbuf = bytearray()
+    wbuf = bytearray()
+    base = prev = None
+    shown = False
+    running = True
+    while running:
+        clock.tick(FPS)
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    running = False
+                elif event.key == pygame.K_x:
+                    inputs.super_pressed = True
+                elif event.key in (pygame.K_1, pygame.K_2, pygame.K_3):
+                    inputs.upgrade_pick = event.key - pygame.K_1
+
+        try:
+            data = sock.recv(1 << 20)
+        except BlockingIOError:
+            data = None
+        except ConnectionError:
+            data = b""
+        if data is not None and not data:
+            print("server closed the connection")
+            break
+        if data:
+            rbuf += data
+            for kind, payload in net_read_frames(rbuf):
+                if kind != NET_SNAPSHOT:
+                    continue
+                header = NET_HEADER.unpack_from(payload)
+                if header[1] == NET_NO_BASE:
+                    base = prev = None
+                body = net_decode(payload[NET_HEADER.size :], net_predict(base, prev))
+                base, prev = body, base
+                apply_net_state(game, header, body)
+                shown = True
+
+        if args.drive:
+            read_keys(pygame.key.get_pressed(), inputs)
+            bits = 0
+            for i, name in enumerate(INPUT_BITS):
+                if getattr(inputs, name):
+                    bits |= 1 << i
+            wbuf += net_frame(NET_INPUT, NET_INPUT_MSG.pack(bits, inputs.upgrade_pick))
+            inputs.clear_edges()
+        if wbuf:
+            # The socket is non-blocking: keep whatever it did not take for the
+            # next frame rather than cutting an input frame in half.
+            try:
+                del wbuf[: sock.send(wbuf)]
+            except BlockingIOError:
+                pass
+
+        fill_background(screen)
+        if shown:
+            draw_world(screen, sprites, game, COLOR_PALETTE[0], COLOR_PALETTE[4])
+            hud.draw(screen, fonts.get(28), game, game.mode == "playing")
+            if game.mode == "game_over":
+                draw_text_center(screen, fonts.get(72), "GAME OVER", HEIGHT * 0.42, (255, 255, 255))
+            elif game.mode == "upgrade":
+                draw_text_center(screen, fonts.get(72), "LEVEL CLEARED", HEIGHT * 0.28, (255, 255, 255))
+                for i, (uid, name, desc) in enumerate(game.upgrade_choices):
+                    draw_text_center(screen, fonts.get(28), f"{i+1}. {name}  ({desc})", HEIGHT * (0.42 + 0.08 * i), (220, 220, 220))
+        else:
+            draw_text_center(screen, fonts.get(28), f"Waiting for {args.connect}", HEIGHT * 0.5, (200, 200, 210))
         pygame.display.flip()
 
+    sock.close()
+    pygame.quit()
+    return 0
+
+
+def report_startup(t_main, t_init, t_frame):
+    print(
+        f"startup: import {(t_main - STARTUP_T0) * 1000:.1f} ms, init {(t_init - t_main) * 1000:.1f} ms, "
+        f"first frame {(t_frame - t_init) * 1000:.1f} ms, total {(t_frame - STARTUP_T0) * 1000:.1f} ms"
+    )
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.bench:
+        sys.exit(run_bench(args))
+    if args.sweep:
+        sys.exit(run_sweep(args))
+    if args.serve:
+        sys.exit(run_server(args))
+    if args.connect:
+        sys.exit(run_viewer(args))
+    if args.replay and args.headless:
+        run_headless_replay(args.replay)
+        return
+    if args.telemetry_summary:
+        print_telemetry_summary(args.telemetry_summary)
+        return
+
+    replay = InputReplay.load(args.replay) if args.replay else None
+    t_main = time.perf_counter()
+    app = App(args, replay)
+    t_init = time.perf_counter()
+    first_frame = args.startup_profile
+
+    PROFILER.show_overlay = args.profile
+    if args.profile_out:
+        PROFILER.open_stream(args.profile_out)
+    app.gc.start()
+    hitches = None
+    if args.hitch_log:
+        hitches = HitchDetector(args.hitch_log, app.governor.target_ms, app.gc, args.hitch_trace)
+    telemetry = TelemetryWriter(args.telemetry) if args.telemetry else None
+
+    while app.running:
+        ALLOCATIONS.begin_frame()
+        frame_dt = app.governor.tick(app.clock)
+        PROFILER.begin_frame()
+        t0 = time.perf_counter_ns()
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                app.running = False
+            elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED, pygame.WINDOWRESTORED):
+                app.layer.invalidate()
+            else:
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    PROFILER.show_overlay = not PROFILER.show_overlay
+                app.scene.handle_event(event)
+
+        if replay is None and app.autopilot is None:
+            read_keys(pygame.key.get_pressed(), app.inputs)
+
+        PROFILER.add(PHASE_EVENTS, time.perf_counter_ns() - t0)
+        t0 = time.perf_counter_ns()
+        app.scene.update(frame_dt)
+        PROFILER.add(PHASE_UPDATE, time.perf_counter_ns() - t0)
+        app.scene.render()
+        # Collect before closing the frame so a scheduled collection's time is
+        # counted in the frame that ran it.
+        app.gc.end_frame()
+        PROFILER.end_frame(app.game)
+        if hitches is not None:
+            hitches.end_frame(PROFILER, app.game)
+        if telemetry is not None and app.scene.name == "playing":
+            telemetry.append(PROFILER.last_ms, app.game)
+        if first_frame:
+            first_frame = False
+            report_startup(t_main, t_init, time.perf_counter())
+
+    if app.recorder is not None:
+        app.recorder.save(args.record)
+    PROFILER.close()
+    if hitches is not None:
+        hitches.close()
+    if telemetry is not None:
+        telemetry.close()
     pygame.quit()
     sys.exit(0)
 
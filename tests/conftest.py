@@ -0,0 +1,42 @@
+import os
+import sys
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame  # noqa: E402
+import pytest  # noqa: E402
+
+import main  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def screen():
+    pygame.display.init()
+    surface = pygame.display.set_mode((main.WIDTH, main.HEIGHT))
+    yield surface
+    pygame.display.quit()
+
+
+def play_ticks(game, ticks, recorder=None, ring=None, digests=None, start=1):
+    # Scripted inputs from the bench, picking the first upgrade whenever offered.
+    inputs = main.InputFrame()
+    for tick in range(start, start + ticks):
+        main.bench_inputs(tick, inputs)
+        if game.mode == "upgrade":
+            inputs.upgrade_pick = 0
+        if recorder is not None:
+            recorder.record(inputs)
+        main.step(game, inputs, game.dt)
+        inputs.clear_edges()
+        if ring is not None and ring.advance():
+            ring.capture(game)
+        if digests is not None:
+            digests[tick] = main.state_digest(game)
+        if game.mode == "game_over":
+            break
+
+
+@pytest.fixture
+def play():
+    return play_ticks
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+import main
+
+
+class ListBullet:
+    # The per-object bullet the field replaced: move, cull, then dist2 hit test.
+    def __init__(self, x, y, vx, vy, radius, damage):
+        self.x = x
+        self.y = y
+        self.vx = vx
+        self.vy = vy
+        self.radius = radius
+        self.damage = damage
+        self.dead = False
+
+    def update(self, dt):
+        self.x += self.vx * dt
+        self.y += self.vy * dt
+        if self.x < -40 or self.x > main.WIDTH + 40 or self.y < -60 or self.y > main.HEIGHT + 60:
+            self.dead = True
+
+
+def random_volley(rng, n):
+    ang = rng.uniform(0.0, 2.0 * np.pi, n)
+    spd = rng.uniform(40.0, 400.0, n)
+    return (
+        rng.uniform(-30.0, main.WIDTH + 30.0, n),
+        rng.uniform(-50.0, main.HEIGHT + 50.0, n),
+        np.cos(ang) * spd,
+        np.sin(ang) * spd,
+    )
+
+
+def survivors_of_list(bullets):
+    return sorted((b.x, b.y, b.vx, b.vy) for b in bullets)
+
+
+def survivors_of_field(field):
+    live = field.live()
+    rows = zip(field.x[live].tolist(), field.y[live].tolist(), field.vx[live].tolist(), field.vy[live].tolist())
+    return sorted(rows)
+
+
+@pytest.mark.parametrize("use_grid", [False, True])
+@pytest.mark.parametrize("kind", [main.KIND_ENEMY, main.KIND_PLAYER])
+def test_field_matches_bullet_list(use_grid, kind):
+    rng = np.random.default_rng(11)
+    field = main.BulletField(capacity=16)
+    grid = main.SpatialHash() if use_grid else None
+    bullets = []
+    dealt = 0
+    radius = main.BULLET_KINDS[kind].radius
+    dt = main.SIM_DT
+    for tick in range(400):
+        if tick % 10 == 0:
+            x, y, vx, vy = random_volley(rng, 60)
+            damage = int(rng.integers(1, 4))
+            field.spawn_batch(x, y, vx, vy, kind, damage)
+            bullets += [ListBullet(*row, radius, damage) for row in zip(x.tolist(), y.tolist(), vx.tolist(), vy.tolist())]
+        cx = float(rng.uniform(0.0, main.WIDTH))
+        cy = float(rng.uniform(0.0, main.HEIGHT))
+        r = float(rng.uniform(5.0, 60.0))
+
+        expected = 0
+        for b in bullets:
+            b.update(dt)
+            if not b.dead and main.dist2(b.x, b.y, cx, cy) <= (b.radius + r) ** 2:
+                b.dead = True
+                expected += b.damage
+        bullets = [b for b in bullets if not b.dead]
+
+        field.update(dt)
+        if grid is not None:
+            field.index(grid)
+        assert field.collide_circle(cx, cy, r, grid) == expected
+        dealt += expected
+        field.compact()
+        assert survivors_of_field(field) == survivors_of_list(bullets)
+    assert len(field) == len(bullets) > 0
+    assert dealt > 0
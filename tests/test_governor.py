@@ -0,0 +1,42 @@
+import main
+
+
+def run_frames(governor, frames, full_ms, cheap_ms, update_ms=4.0):
+    modes = []
+    work_ms = update_ms
+    for _ in range(frames):
+        governor._account(work_ms)
+        work_ms = update_ms
+        if governor.should_draw():
+            ms = cheap_ms if governor.render_cheap else full_ms
+            governor.add_render(ms)
+            work_ms += ms
+            modes.append(governor.render_cheap)
+    return modes
+
+
+def test_cheap_mode_sheds_effects_under_load_and_recovers():
+    governor = main.FrameGovernor(adaptive=True)
+    run_frames(governor, 120, full_ms=8.0, cheap_ms=2.0)
+    assert not governor.cheap
+
+    modes = run_frames(governor, 600, full_ms=30.0, cheap_ms=4.0)
+    assert governor.cheap
+    assert governor.skipped_total > 0
+    # Full-quality probe frames keep being drawn while cheap.
+    tail = modes[len(modes) // 2:]
+    assert any(tail) and not all(tail)
+    assert tail.count(False) <= len(tail) // main.CHEAP_PROBE_FRAMES + 1
+
+    # Full effects become affordable again; the probes notice without any help.
+    modes = run_frames(governor, 600, full_ms=8.0, cheap_ms=2.0)
+    assert not governor.cheap
+    assert not any(modes[-60:])
+    assert governor.render_ms_full < 9.0
+
+
+def test_cheap_mode_stays_on_while_full_effects_do_not_fit():
+    governor = main.FrameGovernor(adaptive=True)
+    run_frames(governor, 600, full_ms=30.0, cheap_ms=4.0)
+    run_frames(governor, 600, full_ms=20.0, cheap_ms=4.0)
+    assert governor.cheap
@@ -0,0 +1,101 @@
+import select
+import socket
+
+import numpy as np
+import pytest
+
+import main
+
+
+def snapshot_bodies(play, ticks):
+    game = main.GameState("hard", seed=3)
+    game.jump_to_level(8)
+    game.player.hp = game.player.max_hp = 10**6
+    bodies = []
+    for tick in range(ticks):
+        play(game, 2, start=2 * tick + 1)
+        bodies.append(main.net_state(game, tick)[1])
+    return game, bodies
+
+
+def test_codec_round_trip_is_lossless(play):
+    _, bodies = snapshot_bodies(play, 120)
+    base = prev = None
+    for body in bodies:
+        # Both ends predict from the same two previously sent bodies.
+        data = main.net_encode(body, main.net_predict(base, prev))
+        decoded = main.net_decode(data, main.net_predict(base, prev))
+        assert decoded.dtype == np.int16
+        assert np.array_equal(decoded, body)
+        prev, base = base, body
+
+
+def test_snapshot_applies_to_a_viewer_game(play):
+    game, bodies = snapshot_bodies(play, 30)
+    header, body = main.net_state(game, 30)
+    payload = main.NET_HEADER.pack(*header) + main.net_encode(body, None)
+    viewer = main.GameState("hard")
+    main.apply_net_state(viewer, main.NET_HEADER.unpack_from(payload), main.net_decode(payload[main.NET_HEADER.size :], None))
+
+    assert (viewer.level, viewer.boss_hp, viewer.player.hp) == (game.level, game.boss_hp, game.player.hp)
+    for sent, shown in ((game.enemy_bullets, viewer.enemy_bullets), (game.player_bullets, viewer.player_bullets)):
+        assert len(shown) == len(sent)
+        # The viewer regroups player bullets by kind, so compare sorted.
+        error = np.sort(shown.x[: len(shown)]) - np.sort(sent.x[sent.live()])
+        assert np.abs(error).max(initial=0.0) <= 0.5 / main.NET_SCALE
+
+
+def test_boss_hp_past_int32_survives_the_header():
+    game = main.GameState("hard", seed=3)
+    for level in (55, 200):
+        game.jump_to_level(level)
+        header, _ = main.net_state(game, 1)
+        unpacked = main.NET_HEADER.unpack(main.NET_HEADER.pack(*header))
+        assert unpacked[6] == min(game.boss_hp, main.NET_HP_MAX)
+        assert unpacked[6] > 2**31
+
+
+@pytest.fixture
+def server():
+    server = main.GameServer(main.parse_args(["--serve", "127.0.0.1:0", "--seed", "1"]))
+    yield server
+    for client in list(server.clients):
+        server.drop(client)
+    server.listener.close()
+
+
+def connect(server, *frames):
+    sock = socket.create_connection(server.listener.getsockname())
+    server.accept()
+    client = server.clients[-1]
+    sock.sendall(b"".join(main.net_frame(kind, payload) for kind, payload in frames))
+    select.select([client.sock], [], [], 1.0)
+    server.receive(client)
+    return sock, client
+
+
+def test_driver_input_reaches_the_server(server):
+    pick = main.NET_INPUT_MSG.pack(1 << main.INPUT_BITS.index("shoot"), 2)
+    sock, client = connect(server, (main.NET_HELLO, bytes((main.NET_ROLE_DRIVE,))), (main.NET_INPUT, pick))
+    assert server.driver() is client
+    assert server.inputs.shoot and server.inputs.upgrade_pick == 2
+    sock.close()
+
+
+@pytest.mark.parametrize(
+    "frame",
+    [
+        (main.NET_HELLO, b""),
+        (main.NET_HELLO, bytes((7,))),
+        (main.NET_INPUT, b"\x01"),
+        (main.NET_INPUT, b"\x01\x00\x00"),
+        (99, b"\x00"),
+    ],
+)
+def test_malformed_frames_drop_only_that_client(server, frame):
+    viewer, _ = connect(server, (main.NET_HELLO, bytes((main.NET_ROLE_VIEW,))))
+    bad, client = connect(server, (main.NET_HELLO, bytes((main.NET_ROLE_DRIVE,))), frame)
+    assert client not in server.clients
+    assert len(server.clients) == 1
+    viewer.close()
+    bad.close()
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+import main
+
+
+def fire_once(spec, dt):
+    game = main.GameState(seed=1)
+    schedule = main.PatternSchedule([spec], 1)
+    bullets = main.BulletField()
+    t = float(schedule.times[0])
+    schedule.advance(t, game.enemy, game.player, bullets, game.rng, dt)
+    return game.enemy, bullets
+
+
+@pytest.mark.parametrize("dt", [None, 0.0])
+def test_emitter_offsets_volley_origin(dt):
+    spec = main.PATTERN_POOL[0]
+    offset = main.PatternSpec(spec.name, spec.period, spec.speed, spec.angle, spec.count, main.Emitter(-40.0, 25.0))
+    _, centred = fire_once(spec, dt)
+    _, shifted = fire_once(offset, dt)
+    n = centred.count
+    assert n > 0 and shifted.count == n
+    assert np.allclose(shifted.x[:n] - centred.x[:n], -40.0)
+    assert np.allclose(shifted.y[:n] - centred.y[:n], 25.0)
+    assert np.array_equal(shifted.vx[:n], centred.vx[:n])
+
+
+def test_pool_fires_from_the_boss():
+    assert all(spec.emitter is main.BOSS_EMITTER for spec in main.PATTERN_POOL)
@@ -0,0 +1,50 @@
+import numpy as np
+import pygame
+import pytest
+
+import main
+
+
+def pixels(surface):
+    return pygame.surfarray.array2d(surface)
+
+
+def blank(screen):
+    main.fill_background(screen)
+    return screen
+
+
+
+@pytest.mark.parametrize("cheap", [False, True])
+def test_raster_matches_blits(screen, cheap):
+    sprites = main.SpriteCache()
+    rng = np.random.default_rng(7)
+    xs = rng.integers(-20, main.WIDTH + 20, 6000)
+    ys = rng.integers(-20, main.HEIGHT + 20, 6000)
+    surf, (ox, oy) = sprites.bullet(main.KIND_ENEMY, cheap)
+
+    blank(screen).blits([(surf, (x - ox, y - oy)) for x, y in zip(xs.tolist(), ys.tolist())], doreturn=False)
+    expected = pixels(screen)
+
+    edge = main.raster_bullets(blank(screen), sprites.stamp(main.KIND_ENEMY, cheap, screen), xs, ys)
+    screen.blits([(surf, (x - ox, y - oy)) for x, y in zip(xs[edge].tolist(), ys[edge].tolist())], doreturn=False)
+    assert np.array_equal(pixels(screen), expected)
+
+
+@pytest.mark.parametrize("motion", main.MOTION_MODES)
+def test_draw_world_raster_path_is_pixel_identical(screen, monkeypatch, motion):
+    game = main.GameState(seed=3, motion=motion)
+    game.reset_run(3)
+    np_rng = np.random.default_rng(3)
+    main.bench_setup_field(game, np_rng)
+    main.bench_top_up_field(game, np_rng)
+    main.step(game, main.InputFrame(), game.dt)
+    assert len(game.enemy_bullets) >= main.RASTER_THRESHOLD
+    sprites = main.SpriteCache()
+    colors = (main.COLOR_PALETTE[0], main.COLOR_PALETTE[4])
+
+    main.draw_world(blank(screen), sprites, game, *colors, 0.5)
+    rastered = pixels(screen)
+    monkeypatch.setattr(main, "RASTER_THRESHOLD", 1 << 30)
+    main.draw_world(blank(screen), sprites, game, *colors, 0.5)
+    assert np.array_equal(rastered, pixels(screen))
@@ -0,0 +1,50 @@
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize("motion", main.MOTION_MODES)
+def test_replay_reproduces_run(tmp_path, play, motion):
+    game = main.GameState("easy", motion=motion)
+    game.reset_run(1234)
+    recorder = main.InputRecorder(game.seed, game.difficulty, motion)
+    play(game, 720, recorder)
+    path = tmp_path / "run.bhr"
+    recorder.save(path)
+
+    replay = main.InputReplay.load(path)
+    assert (replay.seed, replay.difficulty, replay.motion) == (1234, "easy", motion)
+    replayed = main.simulate_replay(replay)
+    assert replay.done
+    assert main.state_digest(replayed) == main.state_digest(game)
+    assert replayed.t_global == game.t_global
+
+
+def test_different_seeds_diverge(play):
+    digests = set()
+    for seed in (1, 2):
+        game = main.GameState("easy")
+        game.reset_run(seed)
+        play(game, 600)
+        digests.add(main.state_digest(game))
+    assert len(digests) == 2
+
+
+@pytest.mark.parametrize("seed", ["-1", "4294967296", "5000000000"])
+def test_out_of_range_seed_is_rejected(seed):
+    with pytest.raises(SystemExit):
+        main.parse_args(["--seed", seed])
+
+
+def test_largest_seed_records(tmp_path):
+    args = main.parse_args(["--seed", "4294967295"])
+    recorder = main.InputRecorder(args.seed, "normal")
+    recorder.save(tmp_path / "run.bhr")
+    assert main.InputReplay.load(tmp_path / "run.bhr").seed == 4294967295
+
+
+def test_digest_survives_late_level_boss_hp():
+    game = main.GameState("hard", seed=1)
+    game.jump_to_level(56)
+    assert game.boss_hp > 2**31
+    assert main.state_digest(game) != main.state_digest(main.GameState("hard", seed=1))
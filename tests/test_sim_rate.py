@@ -0,0 +1,53 @@
+import pytest
+
+import main
+
+RATES = (15, 30, 60, 120, 240)
+DECIDE_HZ = 15
+
+
+def boss_damage(sim_hz, seconds=10.0):
+    game = main.GameState("normal", seed=4, sim_hz=sim_hz)
+    game.jump_to_level(10)
+    game.player.hp = game.player.max_hp = 10**6
+    game.boss_hp = game.boss_max_hp = 10**9
+    inputs = main.InputFrame()
+    inputs.shoot = True
+    every = sim_hz // DECIDE_HZ
+    for tick in range(int(seconds * sim_hz)):
+        # Inputs change only on ticks every rate shares, so the ship flies the
+        # same path at every rate while chasing the boss.
+        if tick % every == 0:
+            inputs.left = game.player.x > game.enemy.x + 8
+            inputs.right = game.player.x < game.enemy.x - 8
+            inputs.up = (tick // sim_hz) % 2 == 0
+            inputs.down = not inputs.up
+        main.step(game, inputs, game.dt)
+    return 10**9 - game.boss_hp
+
+
+def test_hits_match_across_tick_rates_with_a_moving_ship(monkeypatch):
+    # A boss on a straight line is swept exactly at every rate.
+    monkeypatch.setattr(main.Enemy, "x_at", lambda self, t: self.base_x - 100.0 + 20.0 * t)
+    damage = {hz: boss_damage(hz) for hz in RATES}
+    assert len(set(damage.values())) == 1, damage
+    assert damage[RATES[0]] > 0
+
+
+def test_hits_match_across_common_tick_rates():
+    # The real boss follows a curve, swept as one chord per tick; from 30 Hz up
+    # the chords are close enough that every hit lands the same.
+    damage = {hz: boss_damage(hz) for hz in RATES[1:]}
+    assert len(set(damage.values())) == 1, damage
+
+
+@pytest.mark.parametrize("sim_hz", [60, 30])
+def test_replay_reproduces_run_at_other_rates(tmp_path, play, sim_hz):
+    game = main.GameState("easy", sim_hz=sim_hz)
+    game.reset_run(1234)
+    recorder = main.InputRecorder(game.seed, game.difficulty, game.motion, sim_hz)
+    play(game, 6 * sim_hz, recorder)
+    recorder.save(tmp_path / "run.bhr")
+    replay = main.InputReplay.load(tmp_path / "run.bhr")
+    assert replay.sim_hz == sim_hz
+    assert main.state_digest(main.simulate_replay(replay)) == main.state_digest(game)
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize("motion", main.MOTION_MODES)
+def test_near_point_matches_brute_force(motion):
+    rng = np.random.default_rng(5)
+    field = main.BulletField(motion=motion)
+    grid = main.SpatialHash()
+    checked = 0
+    for tick in range(120):
+        if tick % 7 == 0:
+            n = 200
+            ang = rng.uniform(0.0, 2.0 * np.pi, n)
+            spd = rng.uniform(40.0, 300.0, n)
+            field.spawn_batch(
+                rng.uniform(0.0, main.WIDTH, n), rng.uniform(0.0, main.HEIGHT, n), np.cos(ang) * spd, np.sin(ang) * spd, main.KIND_ENEMY
+            )
+        field.update(main.SIM_DT)
+        field.compact()
+        field.index(grid)
+        if tick % 5 == 0:
+            # Rows spawned after the index must still be found.
+            field.spawn(float(rng.uniform(0.0, main.WIDTH)), float(rng.uniform(0.0, main.HEIGHT)), 0.0, 0.0, main.KIND_ENEMY)
+        x = float(rng.uniform(0.0, main.WIDTH))
+        y = float(rng.uniform(0.0, main.HEIGHT))
+        r = float(rng.uniform(10.0, 120.0))
+
+        rows = np.arange(field.count)
+        rows = rows[field.alive[rows]]
+        px, py = field.positions(rows)
+        expected = rows[main.dist2(px, py, x, y) <= r * r]
+        found = grid.near_point(field, x, y, r)
+        assert sorted(found.tolist()) == sorted(expected.tolist())
+        checked += len(expected)
+    assert checked > 0
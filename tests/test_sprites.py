@@ -0,0 +1,45 @@
+import numpy as np
+import pygame
+import pytest
+
+import main
+
+POINTS = [(40, 40), (400, 300), (3, 597), (799, 0), (-2, 150)]
+
+
+def pixels(surface):
+    return pygame.surfarray.array2d(surface)
+
+
+def blank(screen):
+    main.fill_background(screen)
+    return screen
+
+
+@pytest.mark.parametrize("kind", range(len(main.BULLET_KINDS)))
+def test_bullet_sprites_match_draw_calls(screen, kind):
+    sprites = main.SpriteCache()
+    k = main.BULLET_KINDS[kind]
+    surf, (ox, oy) = sprites.bullet(kind)
+    for x, y in POINTS:
+        pygame.draw.circle(blank(screen), k.color, (x, y), k.radius)
+        expected = pixels(screen)
+        blank(screen).blit(surf, (x - ox, y - oy))
+        assert np.array_equal(pixels(screen), expected)
+
+
+def test_ship_and_pickup_sprites_match_draw_calls(screen):
+    sprites = main.SpriteCache()
+    color = main.COLOR_PALETTE[0]
+    for x, y in POINTS:
+        main.draw_ship(blank(screen), color, x, y)
+        expected = pixels(screen)
+        surf, (ox, oy) = sprites.ship(color)
+        blank(screen).blit(surf, (x - ox, y - oy))
+        assert np.array_equal(pixels(screen), expected)
+
+        main.draw_heal_pickup(blank(screen), x, y)
+        expected = pixels(screen)
+        surf, (ox, oy) = sprites.heal_pickup()
+        blank(screen).blit(surf, (x - ox, y - oy))
+        assert np.array_equal(pixels(screen), expected)